@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict
+from copy import copy
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import SlidingToken
+
+from .versions import get_version
+
+USER_CACHE_SIZE = getattr(settings, 'USER_CACHE_SIZE', 1024)
+USER_CACHE_TTL = getattr(settings, 'USER_CACHE_TTL', 60)
+REVOKED_TOKENS_TTL = getattr(settings, 'REVOKED_TOKENS_TTL', 30)
+REVOKED_TOKENS_VERSION = 'revoked_tokens'
+
+
+def get_user_version(user_id):
+    return f'user:{user_id}'
+
+
+class UserCache:
+    """LRU-кэш аутентифицированных пользователей в памяти процесса
+
+    Запись живёт не дольше ttl секунд и сбрасывается при смене версии
+    пользователя, которую поднимает сохранение или удаление User.
+    """
+
+    def __init__(self, size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                self._users.move_to_end(user_id)
+        if entry is None:
+            return None
+        user, version, expires_at = entry
+        if (time.monotonic() > expires_at
+                or version != get_version(get_user_version(user_id))):
+            self.invalidate(user_id)
+            return None
+        return user
+
+    def set(self, user_id, user):
+        version = get_version(get_user_version(user_id))
+        with self._lock:
+            self._users[user_id] = (
+                user, version, time.monotonic() + self.ttl)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.size:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+
+class RevokedTokens:
+    """Множество jti отозванных токенов в памяти процесса
+
+    Загружается из BlacklistedToken только для неистёкших токенов
+    и перечитывается при смене общей версии или по истечении ttl.
+    """
+
+    def __init__(self, ttl=REVOKED_TOKENS_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._jtis = None
+        self._loaded_at = 0
+        self._version = None
+
+    def load(self):
+        version = get_version(REVOKED_TOKENS_VERSION)
+        jtis = set(BlacklistedToken.objects.filter(
+            token__expires_at__gt=timezone.now()).values_list(
+                'token__jti', flat=True))
+        with self._lock:
+            self._jtis = jtis
+            self._loaded_at = time.monotonic()
+            self._version = version
+
+    def add(self, jti):
+        with self._lock:
+            if self._jtis is not None:
+                self._jtis.add(jti)
+
+    def __contains__(self, jti):
+        if (self._jtis is None
+                or time.monotonic() - self._loaded_at > self.ttl
+                or self._version != get_version(REVOKED_TOKENS_VERSION)):
+            self.load()
+        return jti in self._jtis
+
+
+user_cache = UserCache()
+revoked_tokens = RevokedTokens()
+
+
+class CachedSlidingToken(SlidingToken):
+    """Sliding-токен, который проверяет отзыв по множеству в памяти"""
+
+    def check_blacklist(self):
+        if self.payload[api_settings.JTI_CLAIM] in revoked_tokens:
+            raise TokenError('Token is blacklisted')
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """Аутентификация по JWT с кэшем пользователей в памяти процесса"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(
+                'Token contained no recognizable user identification')
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+        # Каждый запрос получает свою копию, общий объект не меняется
+        return copy(user)
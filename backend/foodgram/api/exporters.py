@@ -0,0 +1,172 @@
+import csv
+
+from recipes.models import ShoppingListItem
+
+CHUNK_SIZE = 64 * 1024
+ITERATOR_CHUNK_SIZE = 2000
+TITLE = 'СПИСОК ПОКУПОК'
+FOOTER = 'Удачных покупок и приятного аппетита! Ваш foodgram'
+CSV_HEADER = ('№', 'Ингредиент', 'Единица измерения', 'Количество')
+
+PDF_PAGE_WIDTH = 595
+PDF_PAGE_HEIGHT = 842
+PDF_MARGIN = 50
+PDF_FONT_SIZE = 12
+PDF_LEADING = 16
+PDF_LINES_PER_PAGE = (PDF_PAGE_HEIGHT - 2 * PDF_MARGIN) // PDF_LEADING
+PDF_ENCODING = 'cp1251'
+# Имена глифов кириллицы (А-Я, а-я) в порядке кодовой страницы cp1251
+PDF_CYRILLIC_GLYPHS = (
+    [f'/afii{10017 + i + (i > 5)}' for i in range(32)]
+    + [f'/afii{10065 + i + (i > 5)}' for i in range(32)])
+
+
+def get_shopping_list(user):
+    """Метод для получения агрегированного списка покупок пользователя"""
+    return ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredient__name', 'ingredient__measurement_unit',
+        'amount').order_by('ingredient__name')
+
+
+def iterate_rows(queryset):
+    """Метод для чтения списка покупок серверным курсором"""
+    return queryset.iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+
+
+def chunked(parts, encoding='utf-8'):
+    """Метод для объединения строк в блоки по CHUNK_SIZE байт"""
+    buffer = []
+    size = 0
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode(encoding)
+        buffer.append(part)
+        size += len(part)
+        if size >= CHUNK_SIZE:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def format_line(number, name, measurement_unit, amount):
+    return f'{number}. {name} ({measurement_unit}) - {amount}'
+
+
+def export_txt(rows):
+    """Метод для построчной выгрузки списка покупок в txt"""
+    yield f'{TITLE} \n \n'
+    for number, row in enumerate(rows, start=1):
+        yield format_line(number, *row) + ' \n'
+    yield f'\n{FOOTER}'
+
+
+class Echo:
+    """Псевдобуфер для csv.writer, возвращающий записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+def export_csv(rows):
+    """Метод для построчной выгрузки списка покупок в csv"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for number, row in enumerate(rows, start=1):
+        yield writer.writerow((number, *row))
+
+
+def pdf_string(text):
+    text = text.encode(PDF_ENCODING, errors='replace')
+    return b'(' + text.replace(b'\\', b'\\\\').replace(
+        b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def pdf_page_content(lines):
+    content = [
+        b'BT',
+        f'/F1 {PDF_FONT_SIZE} Tf {PDF_LEADING} TL'.encode(),
+        f'{PDF_MARGIN} {PDF_PAGE_HEIGHT - PDF_MARGIN} Td'.encode()]
+    for line in lines:
+        content.append(pdf_string(line) + b' Tj T*')
+    content.append(b'ET')
+    return b'\n'.join(content)
+
+
+def pdf_lines(rows):
+    yield TITLE
+    yield ''
+    for number, row in enumerate(rows, start=1):
+        yield format_line(number, *row)
+    yield ''
+    yield FOOTER
+
+
+def export_pdf(rows):
+    """Метод для постраничной выгрузки списка покупок в pdf
+
+    Страницы записываются в поток по мере чтения строк, а объект
+    /Pages и таблица xref - в конце, когда известны все смещения.
+    """
+    offsets = {}
+    position = 0
+    page_ids = []
+
+    def write_object(number, body):
+        nonlocal position
+        offsets[number] = position
+        data = b'%d 0 obj\n' % number + body + b'\nendobj\n'
+        position += len(data)
+        return data
+
+    header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    position += len(header)
+    yield header
+    yield write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    yield write_object(3, (
+        '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+        '/Encoding << /Type /Encoding /BaseEncoding /WinAnsiEncoding '
+        '/Differences [168 /afii10023 184 /afii10071 192 '
+        + ' '.join(PDF_CYRILLIC_GLYPHS) + '] >> >>').encode())
+    next_id = 4
+
+    def write_page(lines):
+        nonlocal next_id
+        content = pdf_page_content(lines)
+        content_id, page_id = next_id, next_id + 1
+        next_id += 2
+        page_ids.append(page_id)
+        return write_object(
+            content_id, b'<< /Length %d >>\nstream\n' % len(content)
+            + content + b'\nendstream') + write_object(page_id, (
+                f'<< /Type /Page /Parent 2 0 R '
+                f'/MediaBox [0 0 {PDF_PAGE_WIDTH} {PDF_PAGE_HEIGHT}] '
+                f'/Resources << /Font << /F1 3 0 R >> >> '
+                f'/Contents {content_id} 0 R >>').encode())
+
+    lines = []
+    for line in pdf_lines(rows):
+        lines.append(line)
+        if len(lines) == PDF_LINES_PER_PAGE:
+            yield write_page(lines)
+            lines = []
+    if lines:
+        yield write_page(lines)
+    kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+    yield write_object(2, (
+        f'<< /Type /Pages /Kids [{kids}] '
+        f'/Count {len(page_ids)} >>').encode())
+    xref = [b'xref\n0 %d\n' % next_id, b'0000000000 65535 f \n']
+    xref.extend(b'%010d 00000 n \n' % offsets[number]
+                for number in range(1, next_id))
+    yield b''.join(xref)
+    yield (b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+           % (next_id, position))
+
+
+EXPORTERS = {
+    'txt': (export_txt, 'text/plain; charset=utf-8'),
+    'csv': (export_csv, 'text/csv; charset=utf-8'),
+    'pdf': (export_pdf, 'application/pdf'),
+}
@@ -0,0 +1,140 @@
+import csv
+import io
+import random
+from itertools import accumulate
+
+import django
+from django.db import connection, transaction
+
+from recipes.models import Cart, Favorite, IngredientRecipe, TagRecipe
+from users.models import Subscription
+from .utils import insert_rows
+
+# Данные, общие для всех чанков; передаются в процесс один раз
+_context = {}
+
+
+class ZipfSampler:
+    """Выборка элементов с вероятностью, обратной степени их ранга
+
+    Ранг задаётся порядком items: первый элемент самый популярный.
+    """
+
+    def __init__(self, items, exponent):
+        self.items = items
+        self.cum_weights = list(accumulate(
+            rank ** -exponent for rank in range(1, len(items) + 1)))
+
+    def choice(self, rng):
+        return rng.choices(self.items, cum_weights=self.cum_weights)[0]
+
+    def sample(self, rng, count):
+        """Метод для выборки count различных элементов"""
+        count = min(count, len(self.items))
+        if count * 2 > len(self.items):
+            return rng.sample(self.items, count)
+        chosen = set()
+        while len(chosen) < count:
+            chosen.update(rng.choices(
+                self.items, cum_weights=self.cum_weights,
+                k=count - len(chosen)))
+        return sorted(chosen)
+
+
+def get_count(rng, mean):
+    """Метод для случайного числа элементов со средним mean"""
+    return rng.randint(mean // 2, mean + mean // 2) if mean else 0
+
+
+def generate_ingredients(rng, recipe_ids):
+    ingredients = _context['ingredients']
+    mean = _context['ingredients_per_recipe']
+    for recipe_id in recipe_ids:
+        for ingredient_id in ingredients.sample(
+                rng, max(get_count(rng, mean), 1)):
+            yield recipe_id, ingredient_id, rng.randint(1, 500)
+
+
+def generate_tags(rng, recipe_ids):
+    tags = _context['tags']
+    count = min(_context['tags_per_recipe'], len(tags))
+    for recipe_id in recipe_ids:
+        for tag_id in rng.sample(tags, count):
+            yield recipe_id, tag_id
+
+
+def generate_recipe_links(name):
+    def generate(rng, user_ids):
+        recipes = _context['recipes']
+        mean = _context[f'{name}_per_user']
+        for user_id in user_ids:
+            for recipe_id in recipes.sample(rng, get_count(rng, mean)):
+                yield user_id, recipe_id
+    return generate
+
+
+def generate_subscriptions(rng, user_ids):
+    authors = _context['authors']
+    mean = _context['subscriptions_per_user']
+    for user_id in user_ids:
+        count = get_count(rng, mean)
+        author_ids = authors.sample(rng, count + 1)
+        if user_id in author_ids:
+            author_ids.remove(user_id)
+        elif author_ids:
+            author_ids.pop(rng.randrange(len(author_ids)))
+        for author_id in author_ids:
+            yield user_id, author_id
+
+
+# Таблица, её колонки и генератор строк по чанку id рецептов или
+# пользователей
+RELATIONS = {
+    'ingredients': (IngredientRecipe, ('recipe', 'ingredient', 'amount'),
+                    generate_ingredients),
+    'tags': (TagRecipe, ('recipe', 'tag'), generate_tags),
+    'favorites': (Favorite, ('user', 'recipe'),
+                  generate_recipe_links('favorites')),
+    'carts': (Cart, ('user', 'recipe'), generate_recipe_links('carts')),
+    'subscriptions': (Subscription, ('user', 'author'),
+                      generate_subscriptions),
+}
+
+
+def init_worker(context):
+    """Метод для подготовки процесса-исполнителя"""
+    django.setup()
+    _context.clear()
+    _context.update(context)
+
+
+def write_rows(model, fields, rows):
+    """Метод для записи строк через COPY или многострочный INSERT"""
+    if connection.vendor != 'postgresql':
+        insert_rows(model, fields, rows)
+        return
+    columns = ', '.join(
+        connection.ops.quote_name(model._meta.get_field(field).column)
+        for field in fields)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {connection.ops.quote_name(model._meta.db_table)} '
+            f'({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def generate_chunk(task):
+    """Метод для генерации и записи одного чанка связей
+
+    Генератор случайных чисел зависит только от seed, таблицы и номера
+    чанка, поэтому результат не зависит от числа процессов.
+    """
+    name, index, ids = task
+    model, fields, generate = RELATIONS[name]
+    rng = random.Random(f'{_context["seed"]}:{name}:{index}')
+    rows = list(generate(rng, ids))
+    with transaction.atomic():
+        write_rows(model, fields, rows)
+    return name, len(rows)
@@ -0,0 +1,67 @@
+from heapq import merge
+from itertools import islice
+
+from django.conf import settings
+
+from recipes.models import Recipe, TimelineEntry
+from users.models import Subscription, User
+
+# Рецепты авторов с большим числом подписчиков читаются при запросе ленты
+FEED_FANOUT_LIMIT = getattr(settings, 'FEED_FANOUT_LIMIT', 1000)
+
+
+def fan_out_recipe(recipe):
+    """Метод для раскладки нового рецепта по лентам подписчиков
+
+    Рецепт автора, у которого подписчиков не меньше FEED_FANOUT_LIMIT,
+    не раскладывается и остаётся с fanned_out=False: такие рецепты
+    лента достаёт сама при чтении.
+    """
+    followers_count = User.objects.filter(id=recipe.author_id).values_list(
+        'followers_count', flat=True).first()
+    if followers_count is None or followers_count >= FEED_FANOUT_LIMIT:
+        return
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, recipe_id=recipe.id,
+                       author_id=recipe.author_id)
+         for user_id in Subscription.objects.filter(
+             author_id=recipe.author_id).values_list('user_id', flat=True)),
+        ignore_conflicts=True)
+    Recipe.objects.filter(id=recipe.id).update(fanned_out=True)
+    recipe.fanned_out = True
+
+
+def backfill_timeline(user, author):
+    """Метод для добавления в ленту разложенных рецептов нового автора"""
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user.id, recipe_id=recipe_id,
+                       author_id=author.id)
+         for recipe_id in Recipe.objects.filter(
+             author=author, fanned_out=True).values_list('id', flat=True)),
+        ignore_conflicts=True)
+
+
+def prune_timeline(user, author):
+    """Метод для удаления из ленты рецептов автора после отписки"""
+    TimelineEntry.objects.filter(user=user, author=author).delete()
+
+
+def get_feed_ids(user, limit, before=None):
+    """Метод для id рецептов ленты по убыванию, не больше limit + 1
+
+    Сливает два отсортированных потока: записи ленты пользователя
+    и неразложенные рецепты авторов, на которых он подписан. Каждый
+    поток читается по индексу и не длиннее страницы.
+    """
+    entries = TimelineEntry.objects.filter(user=user)
+    pulled = Recipe.objects.filter(
+        fanned_out=False, author__in=Subscription.objects.filter(
+            user=user).values('author_id'))
+    if before is not None:
+        entries = entries.filter(recipe_id__lt=before)
+        pulled = pulled.filter(id__lt=before)
+    return list(islice(merge(
+        entries.order_by('-recipe_id').values_list(
+            'recipe_id', flat=True)[:limit + 1],
+        pulled.order_by('-id').values_list('id', flat=True)[:limit + 1],
+        reverse=True), limit + 1))
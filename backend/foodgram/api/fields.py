@@ -1,8 +1,22 @@
 import base64
 
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 
+from .images import get_variant_name
+
+
+def get_image_url(storage, name, image_processed, variant, request):
+    """Метод для получения ссылки на изображение рецепта нужного размера"""
+    if image_processed == name:
+        url = default_storage.url(get_variant_name(name, variant))
+    else:
+        url = storage.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
 
 class Base64ImageField(serializers.ImageField):
     """Переопределение поля для кодировки изображений"""
@@ -12,3 +26,24 @@ class Base64ImageField(serializers.ImageField):
             ext = format.split('/')[-1]
             data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
         return super().to_internal_value(data)
+
+
+class RecipeImageField(serializers.ImageField):
+    """Поле для вывода уменьшенной копии изображения рецепта
+
+    Размер берётся из контекста (image_variant) или из параметра variant.
+    Пока копии не готовы, отдаётся исходный файл.
+    """
+    def __init__(self, variant='card', **kwargs):
+        self.variant = variant
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        return get_image_url(
+            value.storage, value.name,
+            getattr(value.instance, 'image_processed', None),
+            self.context.get('image_variant', self.variant),
+            self.context.get('request', None))
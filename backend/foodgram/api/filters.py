@@ -1,7 +1,8 @@
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Cart, Favorite, Ingredient, Recipe, Tag, TagRecipe
 from users.models import User
+from .search import search_recipes
 
 
 class IngredientFilter(FilterSet):
@@ -21,21 +22,34 @@ class RecipeFilter(FilterSet):
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
     tags = filters.ModelMultipleChoiceFilter(
         queryset=Tag.objects.all(), field_name='tags__slug',
-        to_field_name='slug')
+        to_field_name='slug', method='get_tags')
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart')
+    search = filters.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'search')
+
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(id__in=TagRecipe.objects.filter(
+            tag__in=value).values('recipe_id'))
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(favorites__user=self.request.user)
+            return queryset.filter(id__in=Favorite.objects.filter(
+                user=self.request.user).values('recipe_id'))
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(carts__user=self.request.user)
+            return queryset.filter(id__in=Cart.objects.filter(
+                user=self.request.user).values('recipe_id'))
         return queryset
+
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
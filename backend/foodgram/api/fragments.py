@@ -0,0 +1,112 @@
+import hashlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from recipes.models import IngredientRecipe, Recipe, TagRecipe
+from .authentication import get_user_version
+from .fields import get_image_url
+from .versions import get_recipe_version, get_versions
+
+RECIPE_FRAGMENT_ALIAS = getattr(settings, 'RECIPE_FRAGMENT_ALIAS', 'default')
+RECIPE_FRAGMENT_TIMEOUT = getattr(settings, 'RECIPE_FRAGMENT_TIMEOUT', 3600)
+FRAGMENT_KEY = 'foodgram:fragment:{}'
+
+
+def get_fragment_keys(recipes, context):
+    """Метод для получения ключей кэша общих частей рецептов
+
+    Ключ зависит от версии рецепта, версии его автора, версий тэгов и
+    ингредиентов, размера изображения и адреса сайта, с которым
+    строятся ссылки на изображения.
+    """
+    versions = get_versions(
+        {get_recipe_version(recipe.id) for recipe in recipes}
+        | {get_user_version(recipe.author_id) for recipe in recipes}
+        | {'tag', 'ingredient'})
+    request = context.get('request')
+    base_url = request.build_absolute_uri('/') if request else ''
+    shared = (versions['tag'], versions['ingredient'],
+              context.get('image_variant'), base_url)
+    keys = {}
+    for recipe in recipes:
+        key = repr((
+            recipe.id, versions[get_recipe_version(recipe.id)],
+            versions[get_user_version(recipe.author_id)], shared))
+        keys[recipe.id] = FRAGMENT_KEY.format(
+            hashlib.md5(key.encode()).hexdigest())
+    return keys
+
+
+def get_fragments(recipes, context, build):
+    """Метод для получения общих для всех пользователей частей рецептов
+
+    Недостающие части строит build по списку id и кладёт в кэш.
+    Возвращает словарь id -> часть; удалённых рецептов в нём нет.
+    """
+    cache = caches[RECIPE_FRAGMENT_ALIAS]
+    keys = get_fragment_keys(recipes, context)
+    cached = cache.get_many(keys.values())
+    fragments = {recipe_id: cached[key] for recipe_id, key in keys.items()
+                 if key in cached}
+    missing = [recipe_id for recipe_id in keys if recipe_id not in fragments]
+    if missing:
+        built = build(missing)
+        cache.set_many(
+            {keys[recipe_id]: fragment
+             for recipe_id, fragment in built.items()},
+            RECIPE_FRAGMENT_TIMEOUT)
+        fragments.update(built)
+    return fragments
+
+
+def build_fragments(recipe_ids, context):
+    """Метод для построения общих частей рецептов из строк values()
+
+    Результат совпадает с RecipeFragmentSerializer, но строится из
+    плоских кортежей тремя запросами, без вложенных сериалайзеров.
+    """
+    tags = defaultdict(list)
+    for recipe_id, tag_id, name, color, slug in TagRecipe.objects.filter(
+            recipe_id__in=recipe_ids).order_by('tag_id').values_list(
+                'recipe_id', 'tag_id', 'tag__name', 'tag__color',
+                'tag__slug'):
+        tags[recipe_id].append(
+            {'id': tag_id, 'name': name, 'color': color, 'slug': slug})
+    ingredients = defaultdict(list)
+    for (recipe_id, ingredient_id, name, measurement_unit,
+         amount) in IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids).order_by('id').values_list(
+                'recipe_id', 'ingredient_id', 'ingredient__name',
+                'ingredient__measurement_unit', 'amount'):
+        ingredients[recipe_id].append(
+            {'id': ingredient_id, 'name': name,
+             'measurement_unit': measurement_unit, 'amount': amount})
+    storage = Recipe._meta.get_field('image').storage
+    variant = context.get('image_variant', 'card')
+    request = context.get('request')
+    fragments = {}
+    for (recipe_id, name, image, image_processed, text, cooking_time,
+         author_id, email, username, first_name,
+         last_name) in Recipe.objects.filter(
+            id__in=recipe_ids).order_by().values_list(
+                'id', 'name', 'image', 'image_processed', 'text',
+                'cooking_time', 'author_id', 'author__email',
+                'author__username', 'author__first_name',
+                'author__last_name'):
+        fragments[recipe_id] = {
+            'id': recipe_id,
+            'tags': tags[recipe_id],
+            'author': {'email': email, 'id': author_id,
+                       'username': username, 'first_name': first_name,
+                       'last_name': last_name},
+            'ingredients': ingredients[recipe_id],
+            'name': name,
+            'image': get_image_url(
+                storage, image, image_processed, variant, request)
+            if image else None,
+            'text': text,
+            'cooking_time': cooking_time,
+        }
+    return fragments
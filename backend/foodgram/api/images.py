@@ -0,0 +1,147 @@
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image
+
+from recipes.models import Recipe
+from recipes.storage import delete_if_stale
+from .versions import bump_version, get_recipe_version
+
+logger = logging.getLogger(__name__)
+
+IMAGE_VARIANTS = {
+    'thumbnail': (240, 240),
+    'card': (600, 600),
+    'full': (1280, 1280),
+}
+IMAGE_FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+IMAGE_QUALITY = 82
+RECIPE_IMAGE_FORMAT = getattr(settings, 'RECIPE_IMAGE_FORMAT', 'webp')
+RECIPE_IMAGE_WORKERS = getattr(settings, 'RECIPE_IMAGE_WORKERS', 2)
+# Файлы моложе этого срока не удаляются: их может переиспользовать
+# загрузка, транзакция которой ещё не зафиксирована
+RECIPE_IMAGE_GC_GRACE = getattr(settings, 'RECIPE_IMAGE_GC_GRACE', 600)
+
+_executor = None
+
+
+def get_variant_name(name, variant, image_format=RECIPE_IMAGE_FORMAT):
+    """Метод для получения пути к уменьшенной копии изображения"""
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    extension = IMAGE_FORMATS[image_format][1]
+    return posixpath.join(
+        directory, 'variants', f'{stem}_{variant}.{extension}')
+
+
+def encode(image, pil_format):
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, 'white')
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background.paste(image, mask=image.split()[-1])
+        else:
+            background.paste(image.convert('RGB'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, pil_format, quality=IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def render_variants(name):
+    """Метод для создания всех размеров и форматов изображения"""
+    with default_storage.open(name) as file:
+        original = Image.open(file)
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert(
+            'RGBA' if 'transparency' in original.info
+            or original.mode in ('LA', 'P') else 'RGB')
+    for variant, size in IMAGE_VARIANTS.items():
+        image = original.copy()
+        image.thumbnail(size, Image.LANCZOS)
+        for image_format, (pil_format, _) in IMAGE_FORMATS.items():
+            variant_name = get_variant_name(name, variant, image_format)
+            if default_storage.exists(variant_name):
+                default_storage.delete(variant_name)
+            default_storage.save(
+                variant_name, ContentFile(encode(image, pil_format)))
+
+
+def process_recipe_image(recipe_id, name):
+    """Метод для обработки изображения рецепта"""
+    try:
+        render_variants(name)
+        if Recipe.objects.filter(id=recipe_id, image=name).update(
+                image_processed=name):
+            bump_version('recipe')
+            bump_version(get_recipe_version(recipe_id))
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+
+
+def process_in_worker(recipe_id, name):
+    """Метод для обработки изображения в потоке пула"""
+    try:
+        process_recipe_image(recipe_id, name)
+    finally:
+        connection.close()
+
+
+def collect_image(name, grace=RECIPE_IMAGE_GC_GRACE):
+    """Метод для удаления изображения, на которое не ссылаются рецепты
+
+    Файлы, изменённые менее grace секунд назад, остаются до запуска
+    collect_recipe_images: их может переиспользовать параллельная
+    загрузка тех же байтов.
+    """
+    if not name or Recipe.objects.filter(image=name).exists():
+        return False
+    if not delete_if_stale(
+            Recipe._meta.get_field('image').storage, name, grace):
+        return False
+    for variant in IMAGE_VARIANTS:
+        for image_format in IMAGE_FORMATS:
+            delete_if_stale(default_storage,
+                            get_variant_name(name, variant, image_format),
+                            grace)
+    return True
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=RECIPE_IMAGE_WORKERS,
+            thread_name_prefix='recipe-images')
+    return _executor
+
+
+def schedule_image_processing(recipe):
+    """Метод для постановки изображения рецепта в очередь обработки
+
+    Задача отправляется после фиксации транзакции; до её завершения
+    сериалайзеры отдают исходный файл.
+    """
+    name = recipe.image.name
+    if not name or recipe.image_processed == name:
+        return
+    if Recipe.objects.filter(image=name, image_processed=name).exists():
+        Recipe.objects.filter(id=recipe.id).update(image_processed=name)
+        recipe.image_processed = name
+        return
+    if RECIPE_IMAGE_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(
+            process_in_worker, recipe.id, name))
+    else:
+        transaction.on_commit(
+            lambda: process_recipe_image(recipe.id, name))
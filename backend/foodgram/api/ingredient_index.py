@@ -0,0 +1,69 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from recipes.models import Ingredient
+from .versions import get_version
+
+INGREDIENT_INDEX_TTL = getattr(settings, 'INGREDIENT_INDEX_TTL', 300)
+
+
+class IngredientPrefixIndex:
+    """Индекс ингредиентов в памяти процесса для поиска по началу названия
+
+    Ключи - названия в casefold, отсортированные для поиска через bisect.
+    Индекс строится при первом обращении и перестраивается при смене
+    версии таблицы ингредиентов; TTL ограничивает устаревание в процессах,
+    которые не видят общую версию (локальный кэш). Версия, время
+    построения, ключи и записи хранятся одним неизменяемым кортежем,
+    который читается за одно обращение: так invalidate из другого потока
+    не может разрезать их между проверкой и поиском.
+    """
+
+    def __init__(self, ttl=INGREDIENT_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def build(self):
+        version = get_version('ingredient')
+        entries = sorted(
+            (name.casefold(), pk, name, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit').iterator())
+        keys = [entry[0] for entry in entries]
+        items = [{'id': pk, 'name': name, 'measurement_unit': unit}
+                 for _, pk, name, unit in entries]
+        entries = (version, time.monotonic(), keys, items)
+        with self._lock:
+            self._entries = entries
+        return entries
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = None
+
+    def _get_entries(self):
+        entries = self._entries
+        if (entries is None or entries[0] != get_version('ingredient')
+                or time.monotonic() - entries[1] > self.ttl):
+            entries = self.build()
+        return entries[2], entries[3]
+
+    def search(self, prefix, limit=None):
+        keys, items = self._get_entries()
+        prefix = prefix.casefold()
+        start = bisect_left(keys, prefix)
+        result = []
+        for position in range(start, len(keys)):
+            if not keys[position].startswith(prefix):
+                break
+            if limit is not None and len(result) >= limit:
+                break
+            result.append(items[position])
+        return result
+
+
+ingredient_index = IngredientPrefixIndex()
@@ -0,0 +1,244 @@
+import json
+import math
+import platform
+import time
+from datetime import datetime, timezone
+from unittest import mock
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api import images
+from api.images import IMAGE_FORMATS, IMAGE_VARIANTS, get_variant_name
+from api.seed import invalidate_cached_data, seed_dataset
+from api.versions import bump_version
+from recipes.models import Recipe, Tag
+from users.models import User
+
+# Изображение 1x1 для создания рецептов
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAf'
+         'FcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==')
+
+
+def percentile(values, share):
+    """Метод для получения перцентиля по ближайшему рангу"""
+    values = sorted(values)
+    return values[max(math.ceil(share * len(values)) - 1, 0)]
+
+
+def run_on_commit_callbacks(start):
+    """Метод для выполнения колбэков on_commit, добавленных запросом
+
+    Замер идёт в транзакции, которая откатывается, поэтому колбэки
+    не выполнились бы вовсе; они выполняются сразу после запроса, как
+    после фиксации, и замеряются отдельно от него.
+    """
+    while len(connection.run_on_commit) > start:
+        callbacks = connection.run_on_commit[start:]
+        del connection.run_on_commit[start:]
+        for _, callback in callbacks:
+            callback()
+
+
+class Command(BaseCommand):
+    help = ('Замер времени ответа и числа запросов основных эндпоинтов на '
+            'воспроизводимом наборе данных. Результаты (p50/p95 и число '
+            'запросов) пишутся в JSON. Работа колбэков on_commit '
+            'замеряется отдельно. Данные откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes-per-author', type=int, default=10)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites-per-user', type=int, default=10)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument('--subscriptions-per-user', type=int, default=5)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--tags', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--only', nargs='+', default=None,
+                            help='Имена замеров, которые нужно выполнить')
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare', default=None,
+                            help='JSON прошлого запуска для сравнения')
+
+    def handle(self, *args, **options):
+        dataset = {name: options[name] for name in (
+            'users', 'recipes_per_author', 'ingredients_per_recipe',
+            'favorites_per_user', 'carts_per_user',
+            'subscriptions_per_user', 'ingredients', 'tags', 'seed')}
+        try:
+            # Изображения обрабатываются в колбэке, а не в пуле потоков:
+            # потоки не видят данных незафиксированной транзакции
+            with transaction.atomic(), mock.patch.object(
+                    images, 'RECIPE_IMAGE_WORKERS', 0):
+                seeded = seed_dataset(**dataset)
+                # У созданных рецептов нет файлов изображений, поэтому
+                # они отмечаются обработанными, чтобы изменение рецепта
+                # не ставило в очередь обработку несуществующего файла
+                Recipe.objects.filter(id__in=seeded['recipes']).update(
+                    image_processed=F('image'))
+                results = self.run_cases(seeded, options)
+                transaction.set_rollback(True)
+        finally:
+            invalidate_cached_data()
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'dataset': dataset,
+            'repeat': options['repeat'],
+            'results': results,
+        }
+        with open(options['output'], 'w') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['compare']:
+            self.compare(results, options['compare'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты записаны в {options["output"]}'))
+
+    def get_cases(self, seeded):
+        # Пользователь и рецепт берутся из созданных данных: в базе
+        # могут быть настоящие пользователи без рецептов
+        user = User.objects.get(id=seeded['users'][0])
+        slugs = list(Tag.objects.filter(id__in=seeded['tags']).order_by(
+            'id').values_list('slug', flat=True)[:2])
+        tags = '&'.join(f'tags={slug}' for slug in slugs)
+        recipe_id = user.recipes.filter(id__in=seeded['recipes']).order_by(
+            'id').values_list('id', flat=True).first()
+        if recipe_id is None:
+            raise CommandError('Нужен хотя бы один рецепт на автора')
+        ingredients = seeded['ingredients'][:3]
+        payload = {
+            'tags': seeded['tags'][:2],
+            'ingredients': [{'id': ingredient_id, 'amount': 10}
+                            for ingredient_id in ingredients],
+            'name': 'Рецепт для замера',
+            'text': 'Описание рецепта',
+            'cooking_time': 15,
+        }
+        # Повторные анонимные запросы отдаются из кэша ответов; смена
+        # версии рецептов перед запросом даёт промах кэша
+        return (
+            ('список (аноним, из кэша)', None, 'get', '/api/recipes/',
+             None, None),
+            ('список (аноним, без кэша)', None, 'get', '/api/recipes/',
+             None, lambda: bump_version('recipe')),
+            ('список', user, 'get', '/api/recipes/', None, None),
+            ('фильтр по тэгам', user, 'get', f'/api/recipes/?{tags}',
+             None, None),
+            ('фильтр по автору', user, 'get',
+             f'/api/recipes/?author={user.id}', None, None),
+            ('избранное', user, 'get', '/api/recipes/?is_favorited=1',
+             None, None),
+            ('корзина', user, 'get',
+             '/api/recipes/?is_in_shopping_cart=1', None, None),
+            ('поиск', user, 'get', '/api/recipes/?search=рецепт', None, None),
+            ('курсор', user, 'get',
+             f'/api/recipes/?{tags}&pagination=cursor', None, None),
+            ('рецепт', user, 'get', f'/api/recipes/{recipe_id}/', None, None),
+            ('подписки', user, 'get',
+             '/api/users/subscriptions/?recipes_limit=3', None, None),
+            ('ингредиенты', user, 'get',
+             '/api/ingredients/?name=seed ингредиент 1', None, None),
+            ('список покупок', user, 'get',
+             '/api/recipes/download_shopping_cart/', None, None),
+            ('создание рецепта', user, 'post', '/api/recipes/',
+             dict(payload, image=IMAGE), None),
+            ('изменение рецепта', user, 'patch',
+             f'/api/recipes/{recipe_id}/', payload, None),
+        )
+
+    def run_cases(self, seeded, options):
+        results = []
+        for name, user, method, url, data, prepare in self.get_cases(
+                seeded):
+            if options['only'] and name not in options['only']:
+                continue
+            client = APIClient()
+            if user is not None:
+                client.force_authenticate(user)
+            timings, query_counts = [], []
+            on_commit_timings, on_commit_query_counts = [], []
+            for number in range(options['warmup'] + options['repeat']):
+                if prepare is not None:
+                    prepare()
+                start = len(connection.run_on_commit)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = getattr(client, method)(
+                        url, data, format='json')
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    elapsed = time.perf_counter() - started
+                with CaptureQueriesContext(connection) as on_commit_queries:
+                    started = time.perf_counter()
+                    run_on_commit_callbacks(start)
+                    on_commit_elapsed = time.perf_counter() - started
+                if response.status_code >= 400:
+                    raise CommandError(
+                        f'{name}: статус {response.status_code} '
+                        f'{response.content[:200]}')
+                if method == 'post':
+                    self.delete_image(response.data['id'])
+                if number >= options['warmup']:
+                    timings.append(elapsed * 1000)
+                    query_counts.append(len(queries))
+                    on_commit_timings.append(on_commit_elapsed * 1000)
+                    on_commit_query_counts.append(len(on_commit_queries))
+            result = {
+                'name': name,
+                'method': method.upper(),
+                'url': url,
+                'p50_ms': round(percentile(timings, 0.5), 3),
+                'p95_ms': round(percentile(timings, 0.95), 3),
+                'min_ms': round(min(timings), 3),
+                'max_ms': round(max(timings), 3),
+                'queries': percentile(query_counts, 0.5),
+                'queries_max': max(query_counts),
+                'on_commit_p50_ms': round(
+                    percentile(on_commit_timings, 0.5), 3),
+                'on_commit_p95_ms': round(
+                    percentile(on_commit_timings, 0.95), 3),
+                'on_commit_queries': percentile(on_commit_query_counts, 0.5),
+            }
+            results.append(result)
+            self.stdout.write(
+                f'{name}: p50 {result["p50_ms"]:.1f} мс, '
+                f'p95 {result["p95_ms"]:.1f} мс, '
+                f'{result["queries"]} запросов; on_commit p50 '
+                f'{result["on_commit_p50_ms"]:.1f} мс, '
+                f'{result["on_commit_queries"]} запросов')
+        return results
+
+    def delete_image(self, recipe_id):
+        name = Recipe.objects.filter(id=recipe_id).values_list(
+            'image', flat=True).first()
+        if not name:
+            return
+        Recipe._meta.get_field('image').storage.delete(name)
+        for variant in IMAGE_VARIANTS:
+            for image_format in IMAGE_FORMATS:
+                Recipe._meta.get_field('image').storage.delete(
+                    get_variant_name(name, variant, image_format))
+
+    def compare(self, results, path):
+        with open(path) as file:
+            previous = {result['name']: result
+                        for result in json.load(file)['results']}
+        for result in results:
+            before = previous.get(result['name'])
+            if before is None:
+                continue
+            self.stdout.write(
+                f'{result["name"]}: p50 {before["p50_ms"]:.1f} -> '
+                f'{result["p50_ms"]:.1f} мс '
+                f'({result["p50_ms"] / before["p50_ms"]:.2f}x), запросов '
+                f'{before["queries"]} -> {result["queries"]}')
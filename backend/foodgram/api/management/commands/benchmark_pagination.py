@@ -0,0 +1,79 @@
+import time
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIClient
+
+from api.paginators import RecipeCursorPagination
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Сравнение времени ответа глубоких страниц списка рецептов '
+            'в постраничном и курсорном режимах. Данные откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--pages', type=int, nargs='+',
+                            default=(1, 10, 100, 1000, 3000))
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            author = self.seed(options['recipes'])
+            # Анонимные ответы берутся из кэша ответов, поэтому запросы
+            # идут от автора: так измеряются сами запросы страницы
+            client = APIClient()
+            client.force_authenticate(author)
+            limit = options['limit']
+            for page in options['pages']:
+                offset = (page - 1) * limit
+                boundary = Recipe.objects.order_by('-id').values_list(
+                    'id', flat=True)[offset:offset + 1]
+                if not boundary:
+                    break
+                page_number = self.measure(
+                    client, {'page': page, 'limit': limit},
+                    options['repeat'])
+                cursor = self.measure(
+                    client, {'cursor': self.encode_cursor(boundary[0] + 1),
+                             'limit': limit}, options['repeat'])
+                self.stdout.write(
+                    f'страница {page}: page-number {page_number[0]:.1f} мс '
+                    f'({page_number[1]} запросов), cursor {cursor[0]:.1f} мс '
+                    f'({cursor[1]} запросов)')
+            transaction.set_rollback(True)
+
+    def seed(self, count):
+        author = User.objects.create(
+            username='benchmark_pagination',
+            email='benchmark_pagination@foodgram.local',
+            first_name='benchmark', last_name='benchmark')
+        Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'рецепт {number}', text='benchmark',
+                   image='recipes/benchmark.png', cooking_time=1)
+            for number in range(count))
+        return author
+
+    def encode_cursor(self, position):
+        paginator = RecipeCursorPagination()
+        paginator.base_url = ''
+        url = paginator.encode_cursor(
+            Cursor(offset=0, reverse=False, position=str(position)))
+        return parse_qs(urlparse(url).query)[paginator.cursor_query_param][0]
+
+    def measure(self, client, params, repeat):
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get('/api/recipes/', params)
+                timings.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.content
+        timings.sort()
+        return timings[len(timings) // 2] * 1000, len(queries)
@@ -0,0 +1,85 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.utils import update_shopping_lists
+from recipes.models import Cart, Ingredient, IngredientRecipe, Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Замер выгрузки списка покупок для корзины с большим числом '
+            'ингредиентов. Данные создаются в транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', type=int, default=5000)
+        parser.add_argument('--per-recipe', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--formats', nargs='+',
+                            default=('txt', 'csv', 'pdf'))
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self.seed(options['ingredients'], options['per_recipe'])
+            client = APIClient()
+            client.force_authenticate(user)
+            for file_format in options['formats']:
+                self.measure(client, file_format, options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, ingredients_count, per_recipe):
+        user = User.objects.create(
+            username='benchmark_shopping_cart',
+            email='benchmark_shopping_cart@foodgram.local',
+            first_name='benchmark', last_name='benchmark')
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(ingredients_count))
+        if not ingredients[0].pk:
+            ingredients = list(Ingredient.objects.filter(
+                name__startswith='ингредиент ').order_by('id'))
+        recipes_count = -(-ingredients_count // per_recipe)
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=user, name=f'рецепт {number}', text='benchmark',
+                   image='recipes/benchmark.png', cooking_time=1)
+            for number in range(recipes_count))
+        if not recipes[0].pk:
+            recipes = list(Recipe.objects.filter(author=user).order_by('id'))
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipes[number // per_recipe],
+                             ingredient=ingredient, amount=number % 10 + 1)
+            for number, ingredient in enumerate(ingredients))
+        Cart.objects.bulk_create(
+            Cart(user=user, recipe=recipe) for recipe in recipes)
+        update_shopping_lists([user.id], {
+            ingredient.id: number % 10 + 1
+            for number, ingredient in enumerate(ingredients)})
+        self.stdout.write(
+            f'{ingredients_count} ингредиентов в {recipes_count} рецептах')
+        return user
+
+    def measure(self, client, file_format, repeat):
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(
+                    '/api/recipes/download_shopping_cart/',
+                    {'format': file_format})
+                first_chunk = None
+                size = 0
+                for chunk in response.streaming_content:
+                    if first_chunk is None:
+                        first_chunk = time.perf_counter() - started
+                    size += len(chunk)
+                timings.append(
+                    (time.perf_counter() - started, first_chunk or 0))
+        total = min(timing[0] for timing in timings)
+        first = min(timing[1] for timing in timings)
+        self.stdout.write(
+            f'{file_format}: {total * 1000:.1f} мс, первый блок '
+            f'{first * 1000:.1f} мс, {size} байт, '
+            f'{len(queries)} запросов')
@@ -0,0 +1,113 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.seed import invalidate_cached_data, seed_dataset
+from api.similarity import (SIMILAR_LIMIT, find_similar, get_recipe_tokens,
+                            refresh_signatures)
+from api.utils import batched
+from recipes.models import IngredientRecipe, TagRecipe
+
+RECIPES_PER_AUTHOR = 10
+# Рецепты с точным Жаккаром не ниже порога считаются похожими
+RELEVANT_SIMILARITY = 0.5
+
+
+class Command(BaseCommand):
+    help = ('Время построения MinHash-индекса и поиска похожих рецептов '
+            'в зависимости от числа рецептов, полнота относительно '
+            'точного Жаккара. Данные откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=(1000, 5000, 20000))
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument(
+            '--variants', type=float, default=0.2,
+            help='Доля рецептов, переписанных в вариации других рецептов')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            with transaction.atomic():
+                self.measure(size, options)
+                transaction.set_rollback(True)
+            invalidate_cached_data()
+
+    def measure(self, size, options):
+        rng = random.Random(size)
+        seeded = seed_dataset(
+            users=max(size // RECIPES_PER_AUTHOR, 1),
+            recipes_per_author=RECIPES_PER_AUTHOR, favorites_per_user=0,
+            carts_per_user=0, subscriptions_per_user=0)
+        recipe_ids = seeded['recipes']
+        variants = self.make_variants(
+            rng, recipe_ids, seeded['ingredients'], options['variants'])
+        started = time.perf_counter()
+        hashes = {}
+        for batch in batched(recipe_ids, options['batch_size']):
+            refresh_signatures(batch, hashes)
+        build = time.perf_counter() - started
+        tokens = {recipe_id: set(recipe_tokens) for recipe_id, recipe_tokens
+                  in get_recipe_tokens(recipe_ids).items()}
+        timings = []
+        recall = []
+        for recipe_id in rng.sample(
+                variants or recipe_ids, min(options['queries'],
+                                            len(variants or recipe_ids))):
+            started = time.perf_counter()
+            similar = find_similar(recipe_id) or []
+            timings.append((time.perf_counter() - started) * 1000)
+            recall.append(self.recall(recipe_id, similar, tokens))
+        timings.sort()
+        recall = [value for value in recall if value is not None]
+        self.stdout.write(
+            f'{len(recipe_ids)} рецептов: построение {build:.2f} с, поиск '
+            f'p50 {statistics.median(timings):.1f} мс, p95 '
+            f'{timings[int(len(timings) * 0.95) - 1]:.1f} мс, полнота '
+            f'top-{SIMILAR_LIMIT} '
+            f'{statistics.mean(recall) if recall else 1:.2f}')
+
+    def make_variants(self, rng, recipe_ids, ingredient_ids, share):
+        """Метод для копирования рецептов с заменой одного ингредиента"""
+        count = int(len(recipe_ids) * share)
+        if count < 1 or len(recipe_ids) < 2:
+            return []
+        variants = rng.sample(recipe_ids, count)
+        originals = {variant: rng.choice(recipe_ids) for variant in variants}
+        tokens = get_recipe_tokens(list(originals.values()))
+        IngredientRecipe.objects.filter(recipe_id__in=variants).delete()
+        TagRecipe.objects.filter(recipe_id__in=variants).delete()
+        ingredients = []
+        tags = []
+        for variant, original in originals.items():
+            original_ingredients = [token // 2 for token in tokens[original]
+                                    if token % 2 == 0]
+            replaced = rng.randrange(len(original_ingredients))
+            replacement = rng.choice(ingredient_ids)
+            if replacement not in original_ingredients:
+                original_ingredients[replaced] = replacement
+            ingredients.extend(
+                IngredientRecipe(recipe_id=variant, ingredient_id=ingredient,
+                                 amount=1)
+                for ingredient in original_ingredients)
+            tags.extend(TagRecipe(recipe_id=variant, tag_id=token // 2)
+                        for token in tokens[original] if token % 2)
+        for model, objects in ((IngredientRecipe, ingredients),
+                               (TagRecipe, tags)):
+            for batch in batched(objects, 500):
+                model.objects.bulk_create(batch)
+        return variants
+
+    def recall(self, recipe_id, similar, tokens):
+        own = tokens[recipe_id]
+        relevant = {other for other, other_tokens in tokens.items()
+                    if other != recipe_id and len(own & other_tokens)
+                    / len(own | other_tokens) >= RELEVANT_SIMILARITY}
+        if not relevant:
+            return None
+        found = {other for other, _ in similar}
+        return len(found & relevant) / min(len(relevant), SIMILAR_LIMIT)
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.query_plans import check_plan_case, get_plan_cases
+from api.seed import invalidate_cached_data, seed_dataset
+
+
+class Command(BaseCommand):
+    help = ('Проверка планов (EXPLAIN) основных запросов к рецептам на '
+            'заполненной базе: падает при последовательном сканировании '
+            'таблиц связей, дублировании строк или лишних запросах. '
+            'Те же проверки выполняет QueryPlanTest в api/tests.py. '
+            'Данные откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=30)
+        parser.add_argument('--recipes-per-author', type=int, default=10)
+        parser.add_argument('--verbose-plans', action='store_true')
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options['verbose_plans'] else None
+        failures = []
+        try:
+            with transaction.atomic():
+                seeded = seed_dataset(
+                    users=options['users'],
+                    recipes_per_author=options['recipes_per_author'])
+                for name, user, url in get_plan_cases(seeded):
+                    failures.extend(check_plan_case(name, user, url, log))
+                    self.stdout.write(f'{name}: проверен')
+                transaction.set_rollback(True)
+        finally:
+            invalidate_cached_data()
+        if failures:
+            raise CommandError('\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Планы запросов в порядке'))
@@ -0,0 +1,108 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from api.fragments import build_fragments
+from api.renderers import FastJSONRenderer
+from api.seed import invalidate_cached_data, seed_dataset
+from api.serializers import serialize_fragments
+from api.utils import batched
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Проверка, что build_fragments (values()) строит рецепты байт '
+            'в байт как RecipeFragmentSerializer, и сравнение времени '
+            'обоих способов на страницах разного размера. Данные '
+            'откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=30)
+        parser.add_argument('--recipes-per-author', type=int, default=10)
+        parser.add_argument('--page-sizes', type=int, nargs='+',
+                            default=(6, 50))
+        parser.add_argument('--repeat', type=int, default=30)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                seeded = seed_dataset(
+                    users=options['users'],
+                    recipes_per_author=options['recipes_per_author'])
+                recipe_ids = self.prepare(seeded)
+                failures = self.compare_paths(
+                    recipe_ids, options['page_sizes'])
+                if not failures:
+                    self.benchmark(recipe_ids, options)
+                transaction.set_rollback(True)
+        finally:
+            invalidate_cached_data()
+        if failures:
+            raise CommandError('\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS(
+            'Быстрый путь совпадает с сериалайзером'))
+
+    def prepare(self, seeded):
+        """Метод для добавления крайних случаев в набор данных"""
+        recipe_ids = sorted(seeded['recipes'])
+        Recipe.objects.filter(id__in=recipe_ids[::2]).update(
+            image_processed=F('image'))
+        Recipe.objects.filter(id=recipe_ids[0]).update(
+            name='Рецепт "в кавычках" \\ и\nперенос', text='<b>&amp;</b> 😀')
+        Recipe.objects.filter(id=recipe_ids[1]).update(image='')
+        Recipe.objects.get(id=recipe_ids[2]).tags.clear()
+        User.objects.filter(id=seeded['users'][0]).update(
+            first_name='Имя "с кавычками"')
+        return recipe_ids
+
+    def get_contexts(self):
+        request = APIRequestFactory().get('/api/recipes/')
+        return [{'request': request, 'image_variant': variant}
+                for variant in ('card', 'full')] + [{}]
+
+    def compare_paths(self, recipe_ids, page_sizes):
+        failures = []
+        for context in self.get_contexts():
+            for size in page_sizes:
+                for page in batched(recipe_ids, size):
+                    fast = build_fragments(page, context)
+                    reference = serialize_fragments(page, context)
+                    for renderer in (FastJSONRenderer(), JSONRenderer()):
+                        expected = renderer.render(
+                            [reference[recipe_id] for recipe_id in page])
+                        actual = renderer.render(
+                            [fast[recipe_id] for recipe_id in page])
+                        if actual != expected:
+                            failures.append(
+                                f'{context.get("image_variant")}, '
+                                f'страница {page[:3]}...:\n'
+                                f'  ожидалось {expected[:300]}\n'
+                                f'  получено  {actual[:300]}')
+        return failures
+
+    def benchmark(self, recipe_ids, options):
+        context = self.get_contexts()[0]
+        renderer = FastJSONRenderer()
+        for size in options['page_sizes']:
+            page = recipe_ids[:size]
+            for name, build in (('сериалайзер', serialize_fragments),
+                                ('values()', build_fragments)):
+                timings = []
+                for _ in range(options['repeat']):
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        fragments = build(page, context)
+                        renderer.render(
+                            [fragments[recipe_id] for recipe_id in page])
+                        timings.append(time.perf_counter() - started)
+                timings.sort()
+                self.stdout.write(
+                    f'страница {size}, {name}: '
+                    f'{timings[len(timings) // 2] * 1000:.2f} мс, '
+                    f'{len(queries)} запросов')
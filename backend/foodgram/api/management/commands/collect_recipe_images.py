@@ -0,0 +1,51 @@
+import posixpath
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from api.images import RECIPE_IMAGE_GC_GRACE, get_variant_name
+from recipes.models import Recipe
+from recipes.storage import delete_if_stale
+
+IMAGE_DIRECTORY = 'recipes'
+
+
+class Command(BaseCommand):
+    help = ('Удаление файлов изображений и их копий, на которые не '
+            'ссылается ни один рецепт. Файлы моложе --grace секунд '
+            'пропускаются: их может переиспользовать идущая загрузка.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать файлы, которые будут удалены')
+        parser.add_argument('--grace', type=int,
+                            default=RECIPE_IMAGE_GC_GRACE)
+
+    def handle(self, *args, **options):
+        storage = Recipe._meta.get_field('image').storage
+        if not storage.exists(IMAGE_DIRECTORY):
+            return
+        referenced = set(Recipe.objects.values_list('image', flat=True))
+        variants_directory = posixpath.dirname(
+            get_variant_name(posixpath.join(IMAGE_DIRECTORY, 'x'), 'card'))
+        variant_stems = {
+            posixpath.splitext(posixpath.basename(name))[0]
+            for name in referenced}
+        orphans = [
+            (storage, posixpath.join(IMAGE_DIRECTORY, filename))
+            for filename in storage.listdir(IMAGE_DIRECTORY)[1]
+            if posixpath.join(IMAGE_DIRECTORY, filename) not in referenced]
+        if default_storage.exists(variants_directory):
+            orphans.extend(
+                (default_storage, posixpath.join(variants_directory, filename))
+                for filename in default_storage.listdir(variants_directory)[1]
+                if filename.rsplit('_', 1)[0] not in variant_stems)
+        deleted = 0
+        for file_storage, name in orphans:
+            self.stdout.write(name)
+            if not options['dry_run']:
+                deleted += delete_if_stale(
+                    file_storage, name, options['grace'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Неиспользуемых файлов: {len(orphans)}, удалено: {deleted}'))
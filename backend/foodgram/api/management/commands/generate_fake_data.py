@@ -0,0 +1,161 @@
+import multiprocessing
+import os
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Max
+
+from api.fake_data import (RELATIONS, ZipfSampler, generate_chunk,
+                           init_worker)
+from api.seed import invalidate_cached_data
+from api.utils import batched
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+PROGRESS_INTERVAL = 2
+# Команды пересчёта производных данных после вставки
+AGGREGATES = ('reconcile_counters', 'rebuild_shopping_lists',
+              'rebuild_search_index', 'rebuild_similarity_index',
+              'rebuild_timelines')
+
+
+class Command(BaseCommand):
+    help = ('Генерация большого синтетического набора данных для '
+            'нагрузочного тестирования на реальном каталоге ингредиентов: '
+            'популярность ингредиентов, рецептов и авторов распределена '
+            'по Ципфу. Связи пишутся параллельно (COPY на PostgreSQL), '
+            'затем пересчитываются счётчики и индексы.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--favorites-per-user', type=int, default=50)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument('--subscriptions-per-user', type=int, default=20)
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Показатель распределения популярности')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default=None,
+                            help='Префикс имён; по умолчанию fake<seed>')
+        parser.add_argument('--skip-aggregates', action='store_true')
+
+    def handle(self, *args, **options):
+        ingredient_ids = list(Ingredient.objects.order_by('id').values_list(
+            'id', flat=True))
+        tag_ids = list(Tag.objects.order_by('id').values_list(
+            'id', flat=True))
+        if not ingredient_ids or not tag_ids:
+            raise CommandError('Сначала загрузите ингредиенты '
+                               '(load_ingredients) и создайте тэги')
+        prefix = options['prefix'] or f'fake{options["seed"]}'
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+        user_ids = self.create_users(prefix, options)
+        # Порядок в выборке задаёт ранг популярности
+        authors = ZipfSampler(
+            rng.sample(user_ids, len(user_ids)), options['zipf'])
+        recipe_ids = self.create_recipes(prefix, authors, options)
+        context = {
+            'seed': options['seed'],
+            'ingredients': ZipfSampler(rng.sample(
+                ingredient_ids, len(ingredient_ids)), options['zipf']),
+            'tags': tag_ids,
+            'recipes': ZipfSampler(rng.sample(
+                recipe_ids, len(recipe_ids)), options['zipf']),
+            'authors': authors,
+            'ingredients_per_recipe': options['ingredients_per_recipe'],
+            'tags_per_recipe': options['tags_per_recipe'],
+            'favorites_per_user': options['favorites_per_user'],
+            'carts_per_user': options['carts_per_user'],
+            'subscriptions_per_user': options['subscriptions_per_user'],
+        }
+        tasks = {
+            name: [(name, index, ids) for index, ids in enumerate(
+                batched(recipe_ids if name in ('ingredients', 'tags')
+                        else user_ids, options['chunk_size']))]
+            for name in RELATIONS}
+        self.create_relations(tasks, context, options)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {time.perf_counter() - started:.1f} с'))
+        if not options['skip_aggregates']:
+            for command in AGGREGATES:
+                call_command(command, stdout=self.stdout)
+        invalidate_cached_data()
+
+    def create_users(self, prefix, options):
+        last_id = User.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        password = make_password('password')
+        started = time.perf_counter()
+        for batch in batched(range(options['users']), options['batch_size']):
+            User.objects.bulk_create(
+                User(username=f'{prefix}_user_{number}',
+                     email=f'{prefix}_user_{number}@foodgram.local',
+                     first_name='Имя', last_name='Фамилия',
+                     password=password)
+                for number in batch)
+        self.report('users', options['users'], started)
+        return list(User.objects.filter(id__gt=last_id).order_by(
+            'id').values_list('id', flat=True))
+
+    def create_recipes(self, prefix, authors, options):
+        last_id = Recipe.objects.aggregate(
+            last_id=Max('id'))['last_id'] or 0
+        rng = random.Random(f'{options["seed"]}:recipes')
+        started = time.perf_counter()
+        for batch in batched(range(options['recipes']),
+                             options['batch_size']):
+            Recipe.objects.bulk_create(
+                Recipe(author_id=authors.choice(rng),
+                       name=f'{prefix} рецепт {number}',
+                       text='Описание рецепта ' * rng.randint(5, 50),
+                       image=f'recipes/{prefix}.png',
+                       cooking_time=rng.randint(1, 180))
+                for number in batch)
+        self.report('recipes', options['recipes'], started)
+        return list(Recipe.objects.filter(id__gt=last_id).order_by(
+            'id').values_list('id', flat=True))
+
+    def create_relations(self, tasks, context, options):
+        workers = options['workers']
+        if connection.vendor == 'sqlite' or workers <= 1:
+            # SQLite не допускает параллельной записи
+            init_worker(context)
+            for name, chunks in tasks.items():
+                self.run_chunks(name, map(generate_chunk, chunks),
+                                len(chunks))
+            return
+        connections.close_all()
+        with multiprocessing.Pool(workers, initializer=init_worker,
+                                  initargs=(context,)) as pool:
+            for name, chunks in tasks.items():
+                self.run_chunks(
+                    name, pool.imap_unordered(generate_chunk, chunks),
+                    len(chunks))
+
+    def run_chunks(self, name, results, total):
+        started = reported = time.perf_counter()
+        rows = 0
+        for done, (_, count) in enumerate(results, 1):
+            rows += count
+            now = time.perf_counter()
+            if now - reported >= PROGRESS_INTERVAL and done < total:
+                reported = now
+                self.stdout.write(
+                    f'{name}: чанков {done}/{total}, строк {rows} '
+                    f'({rows / (now - started):.0f} строк/с)')
+        self.report(name, rows, started)
+
+    def report(self, name, rows, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{name}: {rows} строк за {elapsed:.1f} с '
+            f'({rows / elapsed if elapsed else rows:.0f} строк/с)')
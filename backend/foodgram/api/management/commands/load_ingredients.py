@@ -0,0 +1,125 @@
+import csv
+import io
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.ingredient_index import ingredient_index
+from api.utils import batched
+from api.versions import bump_version
+from recipes.models import Ingredient
+
+READ_SIZE = 64 * 1024
+
+
+def normalize(value):
+    return ' '.join(str(value).split()).lower()
+
+
+def read_csv(path):
+    """Чтение строк вида [id,]name,measurement_unit из csv-файла"""
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            if len(row) >= 2:
+                yield row[-2], row[-1]
+
+
+def read_json(path):
+    """Потоковое чтение массива объектов из json-файла"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    with open(path, encoding='utf-8') as file:
+        eof = False
+        while True:
+            buffer = buffer.lstrip(' \t\r\n,[')
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except ValueError:
+                if eof:
+                    if buffer.strip():
+                        raise CommandError(f'Некорректный json в {path}')
+                    return
+                chunk = file.read(READ_SIZE)
+                eof = not chunk
+                buffer += chunk
+                continue
+            buffer = buffer[end:]
+            yield item['name'], item['measurement_unit']
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
+
+class Command(BaseCommand):
+    help = ('Загрузка ингредиентов из csv/json пачками, с нормализацией '
+            'и без дублей. Повторный запуск ничего не меняет.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = self.read_rows(options['paths'])
+        before = Ingredient.objects.count()
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                read = self.copy(rows, options['batch_size'])
+            else:
+                read = self.bulk_create(rows, options['batch_size'])
+        created = Ingredient.objects.count() - before
+        ingredient_index.invalidate()
+        bump_version('ingredient')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {read} уникальных строк, добавлено {created} '
+            f'ингредиентов за {elapsed:.2f} с '
+            f'({read / elapsed if elapsed else read:.0f} строк/с)'))
+
+    def read_rows(self, paths):
+        seen = set()
+        for path in paths:
+            reader = READERS.get(path.rsplit('.', 1)[-1].lower())
+            if reader is None:
+                raise CommandError(f'Неизвестный формат файла {path}')
+            for name, measurement_unit in reader(path):
+                key = (normalize(name), normalize(measurement_unit))
+                if key[0] and key not in seen:
+                    seen.add(key)
+                    yield key
+
+    def bulk_create(self, rows, batch_size):
+        read = 0
+        for batch in batched(rows, batch_size):
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=measurement_unit)
+                 for name, measurement_unit in batch),
+                ignore_conflicts=True)
+            read += len(batch)
+        return read
+
+    def copy(self, rows, batch_size):
+        table = Ingredient._meta.db_table
+        read = 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP')
+            for batch in batched(rows, batch_size):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY ingredient_import (name, measurement_unit) '
+                    'FROM STDIN WITH (FORMAT csv)', buffer)
+                read += len(batch)
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredient_import '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING')
+        return read
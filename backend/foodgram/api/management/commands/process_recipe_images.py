@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from api.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Создание уменьшенных копий изображений рецептов, которые '
+            'не были обработаны фоновыми потоками')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать копии для всех рецептов')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.exclude(image_processed=F('image'))
+        recipes = list(recipes.values_list('id', 'image'))
+        for recipe_id, name in recipes:
+            process_recipe_image(recipe_id, name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {len(recipes)}'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from api.search import refresh_search_documents
+from api.utils import batched
+from recipes.models import Recipe
+from recipes.search import install_search_index
+
+
+class Command(BaseCommand):
+    help = ('Пересборка поисковых документов рецептов и полнотекстового '
+            'индекса, например после массовой загрузки данных')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        recipe_ids = list(Recipe.objects.order_by('id').values_list(
+            'id', flat=True))
+        for batch in batched(recipe_ids, options['batch_size']):
+            with transaction.atomic():
+                refresh_search_documents(batch)
+        install_search_index(connection)
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковые документы пересобраны: {len(recipe_ids)}'))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.utils import batched, get_expected_shopping_lists
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = ('Проверка агрегированных списков покупок по корзинам '
+            'и их пересборка с нуля')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить, завершиться с ошибкой при расхождении')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = get_expected_shopping_lists()
+            actual = {
+                (user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount
+                in ShoppingListItem.objects.select_for_update().values_list(
+                    'user_id', 'ingredient_id', 'amount').iterator()}
+            mismatched = {
+                key for key in expected.keys() | actual.keys()
+                if expected.get(key) != actual.get(key)}
+            self.stdout.write(
+                f'Строк в списках: {len(actual)}, ожидается: '
+                f'{len(expected)}, расхождений: {len(mismatched)}')
+            if options['check']:
+                if mismatched:
+                    raise CommandError('Списки покупок рассинхронизированы')
+                return
+            ShoppingListItem.objects.all().delete()
+            for batch in batched(expected.items(), options['batch_size']):
+                ShoppingListItem.objects.bulk_create(
+                    ShoppingListItem(user_id=user_id,
+                                     ingredient_id=ingredient_id,
+                                     amount=amount)
+                    for (user_id, ingredient_id), amount in batch)
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны'))
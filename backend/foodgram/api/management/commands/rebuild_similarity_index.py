@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.similarity import refresh_signatures
+from api.utils import batched
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт MinHash-подписей и LSH-корзин всех рецептов, '
+            'например после массовой загрузки данных')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        recipe_ids = list(Recipe.objects.order_by('id').values_list(
+            'id', flat=True))
+        hashes = {}
+        for batch in batched(recipe_ids, options['batch_size']):
+            with transaction.atomic():
+                refresh_signatures(batch, hashes)
+        self.stdout.write(self.style.SUCCESS(
+            f'Подписи пересчитаны: {len(recipe_ids)}'))
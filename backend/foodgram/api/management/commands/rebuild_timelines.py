@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from api.feed import FEED_FANOUT_LIMIT
+from api.utils import batched
+from recipes.models import Recipe, TimelineEntry
+from users.models import Subscription, User
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = ('Раскладка по лентам подписчиков рецептов, которые лента пока '
+            'читает при запросе, для авторов с числом подписчиков меньше '
+            'FEED_FANOUT_LIMIT')
+
+    def handle(self, *args, **options):
+        authors = list(User.objects.filter(
+            followers_count__lt=FEED_FANOUT_LIMIT,
+            recipes__fanned_out=False).distinct().values_list(
+                'id', flat=True))
+        # Записи лент вставляются одним INSERT ... SELECT на автора,
+        # без создания объектов, и только для заблокированных рецептов:
+        # рецепт, созданный после блокировки, остаётся с fanned_out=False
+        # и не должен попасть в ленту второй раз
+        sql = (
+            f'INSERT INTO {TimelineEntry._meta.db_table} '
+            '(user_id, recipe_id, author_id) '
+            'SELECT subscription.user_id, recipe.id, recipe.author_id '
+            f'FROM {Recipe._meta.db_table} recipe '
+            f'JOIN {Subscription._meta.db_table} subscription '
+            'ON subscription.author_id = recipe.author_id '
+            'WHERE recipe.author_id = %s AND recipe.id IN ({}) '
+            'ON CONFLICT DO NOTHING')
+        entries = 0
+        for author_id in authors:
+            with transaction.atomic():
+                recipe_ids = list(Recipe.objects.select_for_update().filter(
+                    author_id=author_id, fanned_out=False).values_list(
+                        'id', flat=True))
+                with connection.cursor() as cursor:
+                    for batch in batched(recipe_ids, BATCH_SIZE):
+                        cursor.execute(
+                            sql.format(', '.join('%s' for _ in batch)),
+                            [author_id, *batch])
+                        entries += cursor.rowcount
+                Recipe.objects.filter(id__in=recipe_ids).update(
+                    fanned_out=True)
+        self.stdout.write(self.style.SUCCESS(
+            f'Авторов: {len(authors)}, записей в лентах: {entries}'))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Max
+
+from api.utils import count_subquery
+from recipes.models import Cart, Favorite, Recipe
+from users.models import Subscription, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'carts_count', Cart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт денормализованных счётчиков пачками по id'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать число расхождений')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, counter, related_model, field in COUNTERS:
+            fixed = 0
+            last_id = model.objects.aggregate(last_id=Max('id'))['last_id']
+            for start in range(0, (last_id or 0) + 1, batch_size):
+                with transaction.atomic():
+                    drifted = model.objects.filter(
+                        id__gte=start, id__lt=start + batch_size).annotate(
+                            actual=count_subquery(related_model, field)
+                    ).exclude(**{counter: F('actual')}).values_list(
+                        'id', flat=True)
+                    drifted = list(drifted)
+                    if drifted and not options['dry_run']:
+                        model.objects.filter(id__in=drifted).update(
+                            **{counter: count_subquery(related_model, field)})
+                fixed += len(drifted)
+            self.stdout.write(
+                f'{model.__name__}.{counter}: расхождений {fixed}')
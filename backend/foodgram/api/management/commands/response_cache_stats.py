@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.mixins import get_cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = ('Число попаданий и промахов кэша ответов для анонимных '
+            'запросов к рецептам')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true')
+
+    def handle(self, *args, **options):
+        stats = get_cache_stats()
+        total = stats['hit'] + stats['miss']
+        ratio = stats['hit'] / total if total else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Попаданий: {stats["hit"]}, промахов: {stats["miss"]}, '
+            f'доля попаданий: {ratio:.1%}'))
+        if options['reset']:
+            reset_cache_stats()
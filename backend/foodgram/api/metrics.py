@@ -0,0 +1,324 @@
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+METRICS_DIR = getattr(settings, 'METRICS_DIR', None)
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', '')
+METRICS_FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+AGGREGATE_FILE = 'aggregate.json'
+LOCK_FILE = '.lock'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+METRICS = {
+    'foodgram_requests_total': (
+        'counter', 'Число обработанных запросов', None),
+    'foodgram_request_duration_seconds': (
+        'histogram', 'Время обработки запроса', LATENCY_BUCKETS),
+    'foodgram_db_queries': (
+        'histogram', 'Число запросов к базе за запрос', QUERY_BUCKETS),
+    'foodgram_db_duration_seconds': (
+        'histogram', 'Время запросов к базе за запрос', LATENCY_BUCKETS),
+    'foodgram_response_size_bytes': (
+        'histogram', 'Размер тела ответа', SIZE_BUCKETS),
+}
+
+
+class MetricsStore:
+    """Хранилище метрик процесса с выгрузкой в файл
+
+    Каждый процесс копит значения в памяти и не чаще раза в
+    METRICS_FLUSH_INTERVAL секунд атомарно перезаписывает свой файл в
+    METRICS_DIR. Эндпоинт метрик складывает файлы всех процессов, а
+    файлы завершившихся процессов переносит в общий файл-агрегат и
+    удаляет, поэтому счётчики не убывают при перезапуске воркеров, а
+    число файлов не растёт.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._values = {}
+        self._lock = threading.Lock()
+        self._flushed = time.monotonic()
+        self._path = None
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(buckets) + 2)
+            values[bisect_left(buckets, value)] += 1
+            values[-1] += value
+
+    def reset(self):
+        """Метод для сброса значений, унаследованных при fork"""
+        self._lock = threading.Lock()
+        self._values = {}
+        self._path = None
+
+    def get_path(self):
+        if self._path is None:
+            self._path = os.path.join(
+                self.directory, f'{os.getpid()}-{time.time_ns()}.json')
+        return self._path
+
+    def maybe_flush(self):
+        if time.monotonic() - self._flushed >= METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if not self.directory:
+            return
+        path = self.get_path()
+        with self._lock:
+            self._flushed = time.monotonic()
+            rows = [[name, labels, value]
+                    for (name, labels), value in self._values.items()]
+        os.makedirs(self.directory, exist_ok=True)
+        write_json(path, rows)
+
+    def collect(self):
+        """Метод для сложения значений всех процессов"""
+        if not self.directory:
+            with self._lock:
+                return dict(self._values)
+        self.flush()
+        with open(os.path.join(self.directory, LOCK_FILE), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            return self.compact()
+
+    def compact(self):
+        """Метод для переноса файлов завершившихся процессов в агрегат
+
+        В агрегате записаны имена перенесённых файлов: если сбор прервался
+        до их удаления, они удаляются при следующем и не учитываются
+        дважды. Вызывается под блокировкой каталога.
+        """
+        aggregate_path = os.path.join(self.directory, AGGREGATE_FILE)
+        aggregate = read_json(aggregate_path) or {'folded': [], 'rows': []}
+        for name in aggregate['folded']:
+            remove_file(os.path.join(self.directory, name))
+        folded = {}
+        add_rows(folded, aggregate['rows'])
+        live = {}
+        dead = []
+        for entry in os.scandir(self.directory):
+            pid = get_file_pid(entry.name)
+            rows = None if pid is None else read_json(entry.path)
+            if rows is None:
+                continue
+            if is_alive(pid):
+                add_rows(live, rows)
+            else:
+                add_rows(folded, rows)
+                dead.append(entry.name)
+        if dead:
+            write_json(aggregate_path, {
+                'folded': dead,
+                'rows': [[name, labels, value]
+                         for (name, labels), value in folded.items()]})
+            for name in dead:
+                remove_file(os.path.join(self.directory, name))
+        add_rows(live, [[name, labels, value]
+                        for (name, labels), value in folded.items()])
+        return live
+
+
+def get_file_pid(filename):
+    """Метод для получения pid процесса по имени его файла метрик"""
+    stem, extension = os.path.splitext(filename)
+    pid = stem.split('-', 1)[0]
+    if extension != '.json' or not pid.isdigit():
+        return None
+    return int(pid)
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_json(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path, data):
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(data, file)
+    os.replace(temp_path, path)
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def add_rows(totals, rows):
+    """Метод для прибавления строк файла метрик к суммам"""
+    for name, labels, value in rows:
+        if name not in METRICS:
+            continue
+        key = (name, tuple(map(tuple, labels)))
+        current = totals.get(key)
+        if current is None:
+            totals[key] = value
+        elif isinstance(value, list):
+            totals[key] = [a + b for a, b in zip(current, value)]
+        else:
+            totals[key] = current + value
+
+
+store = MetricsStore(METRICS_DIR)
+atexit.register(store.flush)
+os.register_at_fork(after_in_child=store.reset)
+
+
+def format_labels(labels):
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels)
+
+
+def render_metrics(values):
+    """Метод для вывода метрик в текстовом формате Prometheus"""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        rows = sorted(
+            (labels, value) for (metric, labels), value in values.items()
+            if metric == name)
+        for labels, value in rows:
+            if kind == 'counter':
+                lines.append(f'{name}{{{format_labels(labels)}}} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), value):
+                cumulative += count
+                bucket_labels = format_labels(labels + (('le', bound),))
+                lines.append(f'{name}_bucket{{{bucket_labels}}} {cumulative}')
+            lines.append(f'{name}_sum{{{format_labels(labels)}}} {value[-1]}')
+            lines.append(
+                f'{name}_count{{{format_labels(labels)}}} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def get_view_name(request):
+    """Метод для получения имени вьюхи и действия запроса
+
+    Для вьюсетов это класс и действие, например RecipeViewSet.list,
+    для APIView класс и метод. Запросы без совпавшего маршрута
+    собираются под одним именем, чтобы не плодить ряды.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view = match.func
+    method = request.method.lower()
+    view_class = getattr(view, 'cls', None) or getattr(
+        view, 'view_class', None)
+    if view_class is None:
+        return match.view_name or f'{view.__module__}.{view.__name__}'
+    actions = getattr(view, 'actions', None)
+    if actions is not None:
+        action = actions.get(method)
+        if action is None:
+            return f'{view_class.__name__}.unsupported'
+        return f'{view_class.__name__}.{action}'
+    return f'{view_class.__name__}.{method}'
+
+
+class QueryTimer:
+    """Обёртка запросов к базе для подсчёта их числа и времени"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """Промежуточный слой для сбора метрик запросов по вьюхам
+
+    Для потоковых ответов время и запросы к базе учитываются до начала
+    отдачи тела, поскольку оно формируется уже после выхода из слоя, а
+    размер не учитывается.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+        view = get_view_name(request)
+        labels = (('view', view), ('method', request.method))
+        store.inc('foodgram_requests_total',
+                  labels + (('status', response.status_code),))
+        store.observe('foodgram_request_duration_seconds', labels, duration)
+        store.observe('foodgram_db_queries', labels, timer.count)
+        store.observe('foodgram_db_duration_seconds', labels, timer.duration)
+        if not response.streaming:
+            store.observe('foodgram_response_size_bytes', labels,
+                          len(response.content))
+        store.maybe_flush()
+        return response
+
+
+def metrics_view(request):
+    """Вьюха для отдачи метрик Prometheus
+
+    Доступна только с заголовком Authorization: Bearer <METRICS_TOKEN>;
+    без заданного токена эндпоинт отключён.
+    """
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not METRICS_TOKEN or not constant_time_compare(
+            header, f'Bearer {METRICS_TOKEN}'):
+        raise Http404
+    return HttpResponse(
+        render_metrics(store.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,6 +1,162 @@
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework import mixins, viewsets
 
+from .renderers import FastJSONRenderer
+from .versions import VERSIONS_CACHE_ALIAS, get_version, get_versions
+
+RESPONSE_CACHE_ALIAS = getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')
+RESPONSE_CACHE_STATS_ALIAS = getattr(
+    settings, 'RESPONSE_CACHE_STATS_ALIAS', VERSIONS_CACHE_ALIAS)
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+RESPONSE_CACHE_KEY = 'foodgram:response:{}'
+RESPONSE_CACHE_STATS_KEY = 'foodgram:response_cache:{}'
+REFERENCE_DATA_TTL = getattr(settings, 'REFERENCE_DATA_TTL', 300)
+
+
+def record_cache_result(result):
+    """Метод для учёта попаданий и промахов кэша ответов
+
+    Счётчики хранятся в общем для процессов кэше, чтобы команда
+    response_cache_stats видела запросы всех воркеров. Файловый кэш
+    не увеличивает значение атомарно, поэтому при одновременных
+    запросах часть из них может быть не учтена.
+    """
+    cache = caches[RESPONSE_CACHE_STATS_ALIAS]
+    key = RESPONSE_CACHE_STATS_KEY.format(result)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def get_cache_stats():
+    """Метод для получения числа попаданий и промахов кэша ответов"""
+    cache = caches[RESPONSE_CACHE_STATS_ALIAS]
+    return {result: cache.get(RESPONSE_CACHE_STATS_KEY.format(result), 0)
+            for result in ('hit', 'miss')}
+
+
+def reset_cache_stats():
+    """Метод для сброса счётчиков кэша ответов"""
+    caches[RESPONSE_CACHE_STATS_ALIAS].delete_many(
+        [RESPONSE_CACHE_STATS_KEY.format(result)
+         for result in ('hit', 'miss')])
+
 
 class GetPostViewSet(mixins.CreateModelMixin, mixins.ListModelMixin,
                      mixins.RetrieveModelMixin, viewsets.GenericViewSet):
     """Вьюсет для просмотра экземпляров и публикации """
+
+
+class ReferenceDataMixin:
+    """Миксин для условных ответов по версии справочной таблицы
+
+    Ответ без параметров запроса хранится в процессе в виде готового JSON
+    и перестраивается при смене версии таблицы reference_name; TTL
+    ограничивает устаревание, если кэш версий не общий для процессов.
+    """
+    reference_name = None
+    _rendered = {}
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        # Last-Modified с точностью до секунды не различает две записи
+        # в одну секунду, поэтому условные запросы проверяются только по
+        # ETag, а If-Modified-Since без него получает полный ответ
+        version = get_version(self.reference_name)
+        etag = f'"{self.reference_name}-{version!r}"'
+        last_modified = math.ceil(version)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def get_rendered_list(self, version):
+        rendered = self._rendered.get(self.reference_name)
+        if (rendered is None or rendered[0] != version
+                or time.monotonic() - rendered[1] > REFERENCE_DATA_TTL):
+            serializer = self.get_serializer(self.get_queryset(), many=True)
+            rendered = (version, time.monotonic(),
+                        FastJSONRenderer().render(serializer.data))
+            self._rendered[self.reference_name] = rendered
+        return rendered[2]
+
+    def get_list_response(self, request, *args, **kwargs):
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+        return HttpResponse(
+            self.get_rendered_list(get_version(self.reference_name)),
+            content_type='application/json')
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, self.get_list_response, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, super().retrieve, *args, **kwargs)
+
+
+class ResponseCacheMixin:
+    """Миксин для кэширования ответов анонимным пользователям
+
+    Готовый JSON хранится в кэше Django под ключом из действия,
+    нормализованных параметров запроса и версий таблиц cache_versions.
+    Запись в любую из них меняет версию в общем для процессов кэше
+    версий, и старые ключи перестают читаться во всех воркерах, а затем
+    вытесняются по таймауту.
+    """
+    cache_actions = ('list', 'retrieve')
+    cache_versions = ()
+
+    def get_cache_key(self, request):
+        params = sorted(
+            (name, value) for name in request.query_params
+            for value in request.query_params.getlist(name))
+        key = repr((
+            request.build_absolute_uri(request.path), self.action,
+            request.accepted_renderer.format, params,
+            sorted(get_versions(self.cache_versions).items())))
+        return RESPONSE_CACHE_KEY.format(
+            hashlib.md5(key.encode()).hexdigest())
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        if (not request.user.is_anonymous
+                or self.action not in self.cache_actions
+                or request.accepted_renderer.format != 'json'):
+            return handler(request, *args, **kwargs)
+        cache = caches[RESPONSE_CACHE_ALIAS]
+        key = self.get_cache_key(request)
+        content = cache.get(key)
+        result = 'hit'
+        if content is None:
+            result = 'miss'
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            content = request.accepted_renderer.render(
+                response.data, request.accepted_media_type,
+                self.get_renderer_context())
+            cache.set(key, content, RESPONSE_CACHE_TIMEOUT)
+        record_cache_result(result)
+        response = HttpResponse(content, content_type='application/json')
+        response['X-Cache'] = result.upper()
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs)
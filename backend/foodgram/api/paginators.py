@@ -1,6 +1,106 @@
-from rest_framework.pagination import PageNumberPagination
+import binascii
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, CursorPagination,
+                                       PageNumberPagination, _positive_int)
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Курсорная паджинация по убыванию id"""
+    page_size_query_param = 'limit'
+    ordering = '-id'
+
+
+class RecipeMatchPagination(PageNumberPagination):
+    """Постраничная паджинация для списков, собранных в памяти"""
+    page_size_query_param = 'limit'
 
 
 class RecipePagination(PageNumberPagination):
-    """Паджинация  для  рецептов"""
+    """Паджинация  для  рецептов
+
+    По умолчанию постраничная; параметр pagination=cursor (или переданный
+    cursor) включает курсорный режим без COUNT(*) и OFFSET. Курсор
+    упорядочивает по id, поэтому результаты поиска, отсортированные по
+    релевантности, всегда отдаются постранично.
+    """
+    page_size_query_param = 'limit'
+    cursor_pagination_class = RecipeCursorPagination
+    cursor_paginator = None
+    ranked_query_params = ('search',)
+
+    def use_cursor(self, request):
+        if any(request.query_params.get(name)
+               for name in self.ranked_query_params):
+            return False
+        return (request.query_params.get('pagination') == 'cursor'
+                or self.cursor_pagination_class.cursor_query_param
+                in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class FeedPagination(BasePagination):
+    """Курсорная паджинация ленты по id последнего рецепта страницы
+
+    Лента собирается из двух источников, поэтому вместо queryset
+    paginate_queryset принимает функцию fetch(limit, before), которая
+    возвращает не больше limit + 1 id по убыванию.
+    """
+    page_size = api_settings.PAGE_SIZE
     page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True, cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            return int(b64decode(encoded.encode('ascii')).decode('ascii'))
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        encoded = b64encode(str(position).encode('ascii')).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded)
+
+    def paginate_queryset(self, fetch, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        limit = self.get_page_size(request)
+        ids = fetch(limit, self.decode_cursor(request))
+        self.next_position = ids[limit - 1] if len(ids) > limit else None
+        return ids[:limit]
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict((
+            ('next', None if self.next_position is None
+             else self.encode_cursor(self.next_position)),
+            ('previous', None),
+            ('results', data),
+        )))
@@ -0,0 +1,119 @@
+import re
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Tag
+from users.models import User
+
+# Таблицы связей, которые всегда должны читаться по индексу
+INDEXED_TABLES = {
+    'recipes_tagrecipe', 'recipes_ingredientrecipe', 'recipes_favorite',
+    'recipes_cart', 'recipes_shoppinglistitem', 'users_subscription',
+    'recipes_recipebucket', 'recipes_recipesignature',
+    'recipes_timelineentry',
+}
+POSTGRESQL_SCAN = re.compile(r'Seq Scan on (\w+)')
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+# SQLite в плане называет таблицы подзапросов их псевдонимами (U0, T3)
+TABLE_ALIAS = re.compile(r'"(\w+)" ([A-Z]\d+)\b')
+# Число запросов на страницу не должно зависеть от её размера
+QUERY_BUDGET = 6
+
+
+def get_plan_cases(seeded):
+    """Метод для основных запросов к рецептам на заполненной базе
+
+    Пользователь и рецепт берутся из созданных seed_dataset данных.
+    """
+    user = User.objects.get(id=seeded['users'][0])
+    slugs = list(Tag.objects.filter(id__in=seeded['tags']).order_by(
+        '-id').values_list('slug', flat=True)[:2])
+    tags = '&'.join(f'tags={slug}' for slug in slugs)
+    recipe_id = user.recipes.order_by('id').values_list(
+        'id', flat=True).first()
+    return (
+        ('список рецептов', None, '/api/recipes/'),
+        ('список рецептов (авторизован)', user, '/api/recipes/'),
+        ('фильтр по тэгам', user, f'/api/recipes/?{tags}'),
+        ('избранное', user, '/api/recipes/?is_favorited=1'),
+        ('корзина', user, '/api/recipes/?is_in_shopping_cart=1'),
+        ('все фильтры', user, f'/api/recipes/?{tags}&is_favorited=1'
+                              f'&is_in_shopping_cart=1&author={user.id}'),
+        ('курсор', user, f'/api/recipes/?{tags}&pagination=cursor'),
+        ('поиск', user, f'/api/recipes/?search=рецепт&{tags}'),
+        ('рецепт', user, f'/api/recipes/{recipe_id}/'),
+        ('похожие', None, f'/api/recipes/{recipe_id}/similar/'),
+        ('лента', user, '/api/recipes/feed/'),
+        ('подписки', user, '/api/users/subscriptions/?recipes_limit=3'),
+        ('список покупок', user, '/api/recipes/download_shopping_cart/'),
+    )
+
+
+def explain(sql):
+    """Метод для получения плана запроса в виде списка строк"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            return [row[0] for row in cursor.fetchall()]
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN {sql}')
+        return [' '.join(map(str, row)) for row in cursor.fetchall()]
+
+
+def get_scanned_tables(sql, plan):
+    """Метод для таблиц связей, которые план читает целиком"""
+    pattern = (POSTGRESQL_SCAN if connection.vendor == 'postgresql'
+               else SQLITE_SCAN)
+    aliases = {alias: table for table, alias in TABLE_ALIAS.findall(sql)}
+    tables = set()
+    for line in plan:
+        match = pattern.search(line.strip())
+        if match:
+            tables.add(aliases.get(match.group(1), match.group(1)))
+    return tables & INDEXED_TABLES
+
+
+def check_plan_case(name, user, url, log=None):
+    """Метод для проверки одного запроса к API
+
+    Возвращает список найденных проблем: статус ответа, дублирующиеся
+    строки, превышение бюджета запросов и последовательное сканирование
+    таблиц связей. log, если передан, получает каждый запрос и его план.
+    """
+    client = APIClient()
+    if user is not None:
+        client.force_authenticate(user)
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+    if response.status_code != 200:
+        return [f'{name}: статус {response.status_code}']
+    failures = []
+    if not response.streaming:
+        data = response.json()
+        results = data.get('results', ()) if isinstance(data, dict) else data
+        ids = [item['id'] for item in results]
+        if len(ids) != len(set(ids)):
+            failures.append(f'{name}: дублирующиеся строки {ids}')
+    if len(queries) > QUERY_BUDGET:
+        failures.append(f'{name}: {len(queries)} запросов, '
+                        f'ожидалось не больше {QUERY_BUDGET}')
+    for query in queries.captured_queries:
+        sql = query['sql']
+        if not sql.lstrip().upper().startswith('SELECT'):
+            continue
+        plan = explain(sql)
+        if log is not None:
+            log(f'{name}:\n  {sql}\n  ' + '\n  '.join(plan))
+        scanned = get_scanned_tables(sql, plan)
+        if scanned:
+            failures.append(
+                f'{name}: последовательное сканирование '
+                f'{", ".join(sorted(scanned))}\n  {sql}')
+    return failures
@@ -0,0 +1,162 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+
+from recipes.models import IngredientRecipe, Recipe
+from .versions import bump_version, get_version
+
+RECIPE_INDEX_TTL = getattr(settings, 'RECIPE_INDEX_TTL', 300)
+RECIPE_INDEX_REFRESH = getattr(settings, 'RECIPE_INDEX_REFRESH', 30)
+RECIPE_INDEX_VERSION = 'recipe_ingredients'
+
+
+class RecipeIngredientIndex:
+    """Инвертированный индекс ингредиент -> рецепты в памяти процесса
+
+    Для каждого ингредиента хранится отсортированный array id рецептов,
+    для рецепта - его ингредиенты и время приготовления. Процесс, который
+    изменил рецепт, обновляет индекс точечно; остальные перестраивают его
+    при смене общей версии, но не чаще раза в RECIPE_INDEX_REFRESH секунд
+    и отвечают по старому индексу, пока идёт перестройка.
+    """
+
+    def __init__(self, ttl=RECIPE_INDEX_TTL, refresh=RECIPE_INDEX_REFRESH):
+        self.ttl = ttl
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._postings = None
+        self._ingredients = None
+        # Плотные массивы по id рецепта: число ингредиентов и время
+        self._sizes = None
+        self._cooking_times = None
+        self._built_at = 0
+        self._version = None
+
+    def build(self):
+        version = get_version(RECIPE_INDEX_VERSION)
+        ingredients = {}
+        for recipe_id, ingredient_id in IngredientRecipe.objects.order_by(
+                'recipe_id').values_list(
+                    'recipe_id', 'ingredient_id').iterator():
+            ingredients.setdefault(recipe_id, []).append(ingredient_id)
+        cooking_times = dict(Recipe.objects.values_list(
+            'id', 'cooking_time').iterator())
+        size = max(cooking_times, default=0) + 1
+        sizes = array('H', [0]) * size
+        times = array('L', [0]) * size
+        postings = {}
+        for recipe_id in sorted(cooking_times):
+            recipe_ingredients = tuple(ingredients.pop(recipe_id, ()))
+            ingredients[recipe_id] = recipe_ingredients
+            sizes[recipe_id] = len(recipe_ingredients)
+            times[recipe_id] = cooking_times[recipe_id]
+            for ingredient_id in recipe_ingredients:
+                postings.setdefault(ingredient_id, array('L')).append(
+                    recipe_id)
+        with self._lock:
+            self._postings, self._ingredients = postings, ingredients
+            self._sizes, self._cooking_times = sizes, times
+            self._built_at = time.monotonic()
+            self._version = version
+
+    def is_stale(self):
+        if self._postings is None:
+            return True
+        age = time.monotonic() - self._built_at
+        return age > self.ttl or (
+            age > self.refresh
+            and self._version != get_version(RECIPE_INDEX_VERSION))
+
+    def ensure_built(self):
+        if not self.is_stale():
+            return
+        # Первую сборку ждут все, последующие делает один поток
+        if not self._build_lock.acquire(blocking=self._postings is None):
+            return
+        try:
+            if self.is_stale():
+                self.build()
+        finally:
+            self._build_lock.release()
+
+    def _remove(self, recipe_id):
+        for ingredient_id in self._ingredients.pop(recipe_id, ()):
+            posting = self._postings[ingredient_id]
+            position = bisect_left(posting, recipe_id)
+            if position < len(posting) and posting[position] == recipe_id:
+                del posting[position]
+            if not posting:
+                del self._postings[ingredient_id]
+        if recipe_id < len(self._sizes):
+            self._sizes[recipe_id] = 0
+
+    def _add(self, recipe_id, ingredients, cooking_time):
+        missing = recipe_id + 1 - len(self._sizes)
+        if missing > 0:
+            self._sizes.extend(array('H', [0]) * missing)
+            self._cooking_times.extend(array('L', [0]) * missing)
+        self._ingredients[recipe_id] = ingredients
+        self._sizes[recipe_id] = len(ingredients)
+        self._cooking_times[recipe_id] = cooking_time
+        for ingredient_id in ingredients:
+            posting = self._postings.setdefault(ingredient_id, array('L'))
+            posting.insert(bisect_left(posting, recipe_id), recipe_id)
+
+    def refresh_recipe(self, recipe_id):
+        """Метод для точечного обновления рецепта после записи в базу"""
+        in_sync = self._version == get_version(RECIPE_INDEX_VERSION)
+        version = bump_version(RECIPE_INDEX_VERSION)
+        if self._postings is None:
+            return
+        cooking_time = Recipe.objects.filter(id=recipe_id).values_list(
+            'cooking_time', flat=True).first()
+        ingredients = tuple(IngredientRecipe.objects.filter(
+            recipe_id=recipe_id).values_list('ingredient_id', flat=True))
+        with self._lock:
+            self._remove(recipe_id)
+            if cooking_time is not None:
+                self._add(recipe_id, ingredients, cooking_time)
+            if in_sync:
+                self._version = version
+
+    def match(self, ingredient_ids, max_missing=None, cooking_time=None):
+        """Метод для подбора рецептов по имеющимся ингредиентам
+
+        Возвращает кортежи (id рецепта, есть ингредиентов, не хватает)
+        по убыванию покрытых ингредиентов и возрастанию недостающих.
+        """
+        self.ensure_built()
+        if max_missing is None:
+            max_missing = float('inf')
+        if cooking_time is None:
+            cooking_time = float('inf')
+        with self._lock:
+            sizes, times = self._sizes, self._cooking_times
+            covered = Counter()
+            for ingredient_id in set(ingredient_ids):
+                covered.update(self._postings.get(ingredient_id, ()))
+            matches = [
+                (recipe_id, count, sizes[recipe_id] - count)
+                for recipe_id, count in covered.items()
+                if sizes[recipe_id] - count <= max_missing
+                and times[recipe_id] <= cooking_time]
+        # Три устойчивые сортировки по itemgetter быстрее одной по кортежу
+        matches.sort(key=itemgetter(0), reverse=True)
+        matches.sort(key=itemgetter(2))
+        matches.sort(key=itemgetter(1), reverse=True)
+        return matches
+
+
+def schedule_index_update(recipe_id):
+    """Метод для обновления индекса рецепта после коммита транзакции"""
+    transaction.on_commit(lambda: recipe_index.refresh_recipe(recipe_id))
+
+
+recipe_index = RecipeIngredientIndex()
@@ -0,0 +1,58 @@
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Рендерер JSON на orjson
+
+    Без установленного orjson и для ответов с отступами (indent в
+    Accept) работает как стандартный JSONRenderer. Как и он, экранирует
+    U+2028 и U+2029, поэтому строки совпадают побайтно; числа с
+    плавающей точкой в экспоненциальной записи выводятся без знака
+    порядка (1e16 вместо 1e+16), но API таких чисел не отдаёт.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(
+                accepted_media_type, renderer_context or {}):
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        content = orjson.dumps(data, default=self.encoder_class().default,
+                               option=orjson.OPT_NON_STR_KEYS)
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029')
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер для выгрузки списка покупок"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+class TxtRenderer(ShoppingListRenderer):
+    """Рендерер для выгрузки списка покупок в txt"""
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(ShoppingListRenderer):
+    """Рендерер для выгрузки списка покупок в csv"""
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PDFRenderer(ShoppingListRenderer):
+    """Рендерер для выгрузки списка покупок в pdf"""
+    media_type = 'application/pdf'
+    format = 'pdf'
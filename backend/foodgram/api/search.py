@@ -0,0 +1,80 @@
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from recipes.models import IngredientRecipe, Recipe
+from recipes.search import SEARCH_CONFIG, SEARCH_TABLE, SEARCH_VECTOR
+
+SEARCH_TERM = re.compile(r'\w+')
+# Вес названия и документа в bm25 для SQLite
+SQLITE_WEIGHTS = (10.0, 1.0)
+
+
+def get_search_terms(query):
+    return SEARCH_TERM.findall(query.casefold())
+
+
+def search_recipes(queryset, query):
+    """Метод для полнотекстового поиска рецептов по релевантности
+
+    Совпадения отбираются условием, которое обслуживает индекс (GIN на
+    PostgreSQL, FTS5 на SQLite), поэтому остальные фильтры и
+    постраничная пагинация работают как обычно; курсорная пагинация
+    с поиском не используется, так как сортирует по id.
+    """
+    terms = get_search_terms(query)
+    if not terms:
+        return queryset.none()
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        vector = SEARCH_VECTOR.format(
+            config=SEARCH_CONFIG, table='recipes_recipe.')
+        tsquery = f"plainto_tsquery('{SEARCH_CONFIG}', %s)"
+        params = (' '.join(terms),)
+        rank = RawSQL(f'ts_rank({vector}, {tsquery})', params,
+                      output_field=FloatField())
+        # PostgreSQL упрощает условие «выражение = true» до самого
+        # выражения, поэтому GIN-индекс используется
+        queryset = queryset.annotate(search_match=RawSQL(
+            f'({vector}) @@ {tsquery}', params,
+            output_field=BooleanField())).filter(search_match=True)
+    elif vendor == 'sqlite':
+        params = (' '.join(f'"{term}"*' for term in terms),)
+        weights = ', '.join(map(str, SQLITE_WEIGHTS))
+        queryset = queryset.annotate(search_match=RawSQL(
+            f'recipes_recipe.id IN (SELECT rowid FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s)', params,
+            output_field=BooleanField())).filter(search_match=True)
+        rank = RawSQL(
+            f'SELECT -bm25({SEARCH_TABLE}, {weights}) FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s '
+            f'AND {SEARCH_TABLE}.rowid = recipes_recipe.id', params,
+            output_field=FloatField())
+    else:
+        for term in terms:
+            queryset = queryset.filter(search_document__icontains=term)
+        return queryset
+    return queryset.annotate(search_rank=rank).order_by(
+        '-search_rank', '-id')
+
+
+def refresh_search_documents(recipe_ids):
+    """Метод для пересборки поисковых документов рецептов
+
+    Документ состоит из описания и названий ингредиентов, название
+    рецепта индексируется отдельно с большим весом.
+    """
+    names = {}
+    for recipe_id, name in IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids).order_by(
+                'recipe_id', 'ingredient__name').values_list(
+                    'recipe_id', 'ingredient__name'):
+        names.setdefault(recipe_id, []).append(name)
+    recipes = list(Recipe.objects.filter(id__in=recipe_ids).only(
+        'id', 'text'))
+    for recipe in recipes:
+        recipe.search_document = ' '.join(
+            (recipe.text, *names.get(recipe.id, ())))
+    Recipe.objects.bulk_update(recipes, ('search_document',))
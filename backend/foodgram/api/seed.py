@@ -0,0 +1,108 @@
+import random
+from io import StringIO
+
+from django.core.management import call_command
+
+from recipes.models import (Cart, Favorite, Ingredient, IngredientRecipe,
+                            Recipe, Tag, TagRecipe)
+from users.models import Subscription, User
+from .recipe_index import RECIPE_INDEX_VERSION
+from .search import refresh_search_documents
+from .similarity import refresh_signatures
+from .utils import batched
+from .versions import bump_version
+
+BATCH_SIZE = 2000
+SEED_PREFIX = 'seed'
+
+
+def bulk_create(model, objects):
+    for batch in batched(objects, BATCH_SIZE):
+        model.objects.bulk_create(batch)
+
+
+def invalidate_cached_data():
+    """Метод для сброса кэшей после вставки или отката набора данных
+
+    Массовая вставка не отправляет сигналы, поэтому версии таблиц
+    меняются вручную: сразу после заполнения и после отката.
+    """
+    for name in ('tag', 'ingredient', 'recipe', RECIPE_INDEX_VERSION):
+        bump_version(name)
+
+
+def seed_dataset(users=50, recipes_per_author=10, ingredients_per_recipe=8,
+                 tags_per_recipe=2, favorites_per_user=10, carts_per_user=5,
+                 subscriptions_per_user=5, ingredients=500, tags=5, seed=0):
+    """Метод для заполнения базы воспроизводимым набором данных
+
+    Счётчики и списки покупок пересчитываются командами после вставки.
+    Возвращает словарь с id созданных пользователей, рецептов, тэгов
+    и ингредиентов.
+    """
+    rng = random.Random(seed)
+    bulk_create(User, (
+        User(username=f'{SEED_PREFIX}_user_{number}',
+             email=f'{SEED_PREFIX}_user_{number}@foodgram.local',
+             first_name='Имя', last_name='Фамилия', password='password')
+        for number in range(users)))
+    user_ids = list(User.objects.filter(
+        username__startswith=f'{SEED_PREFIX}_user_').order_by(
+            'id').values_list('id', flat=True))
+    bulk_create(Tag, (
+        Tag(name=f'{SEED_PREFIX} тэг {number}',
+            color=f'#{(0x5eed00 + seed * 256 + number) % 0x1000000:06x}',
+            slug=f'{SEED_PREFIX}-{seed}-tag-{number}')
+        for number in range(tags)))
+    tag_ids = list(Tag.objects.filter(
+        slug__startswith=f'{SEED_PREFIX}-{seed}-tag-').values_list(
+            'id', flat=True))
+    bulk_create(Ingredient, (
+        Ingredient(name=f'{SEED_PREFIX} ингредиент {number}',
+                   measurement_unit=rng.choice(('г', 'мл', 'шт')))
+        for number in range(ingredients)))
+    ingredient_ids = list(Ingredient.objects.filter(
+        name__startswith=f'{SEED_PREFIX} ингредиент ').values_list(
+            'id', flat=True))
+    bulk_create(Recipe, (
+        Recipe(author_id=author_id, name=f'{SEED_PREFIX} рецепт {number}',
+               text='Описание рецепта ' * 10,
+               image=f'recipes/{SEED_PREFIX}.png',
+               cooking_time=rng.randint(1, 120))
+        for author_id in user_ids for number in range(recipes_per_author)))
+    recipe_ids = list(Recipe.objects.filter(
+        author_id__in=user_ids).values_list('id', flat=True))
+    bulk_create(TagRecipe, (
+        TagRecipe(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id in recipe_ids
+        for tag_id in rng.sample(tag_ids, min(tags_per_recipe, len(tag_ids)))
+    ))
+    bulk_create(IngredientRecipe, (
+        IngredientRecipe(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                         amount=rng.randint(1, 500))
+        for recipe_id in recipe_ids
+        for ingredient_id in rng.sample(
+            ingredient_ids, min(ingredients_per_recipe, len(ingredient_ids)))
+    ))
+    for model, per_user in ((Favorite, favorites_per_user),
+                            (Cart, carts_per_user)):
+        bulk_create(model, (
+            model(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in rng.sample(
+                recipe_ids, min(per_user, len(recipe_ids)))))
+    bulk_create(Subscription, (
+        Subscription(user_id=user_id, author_id=author_id)
+        for user_id in user_ids
+        for author_id in rng.sample(
+            [author for author in user_ids if author != user_id],
+            min(subscriptions_per_user, len(user_ids) - 1))))
+    hashes = {}
+    for batch in batched(recipe_ids, BATCH_SIZE // 4):
+        refresh_search_documents(batch)
+        refresh_signatures(batch, hashes)
+    call_command('rebuild_shopping_lists', stdout=StringIO())
+    call_command('reconcile_counters', stdout=StringIO())
+    invalidate_cached_data()
+    return {'users': user_ids, 'recipes': recipe_ids, 'tags': tag_ids,
+            'ingredients': ingredient_ids}
@@ -1,10 +1,23 @@
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import Manager
+from django.utils.crypto import constant_time_compare
 from rest_framework import exceptions, serializers
 
 from recipes.models import (Cart, Favorite, Ingredient,
-                            IngredientRecipe, Recipe, Tag, TagRecipe)
+                            IngredientRecipe, Recipe, Tag)
 from users.models import Subscription, User
-from .fields import Base64ImageField
-from .utils import create_tags_and_ingredient_recipe
+from .fields import Base64ImageField, RecipeImageField
+from .fragments import build_fragments, get_fragments
+from .images import schedule_image_processing
+from .recipe_index import schedule_index_update
+from .search import refresh_search_documents
+from .similarity import refresh_signatures
+from .utils import (create_tags_and_ingredient_recipe, get_cart_users,
+                    get_recipe_prefetches, update_ingredient_recipe,
+                    update_shopping_lists, update_tag_recipe)
+from .versions import bump_version, get_recipe_version
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -30,6 +43,8 @@ class UserSubscribeSerializer(UserSerializer):
         read_only_fields = ('id', )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         if not self.context['request'].user.is_authenticated:
             return False
         return Subscription.objects.filter(user=self.context['request'].user,
@@ -43,13 +58,14 @@ class JWTTokenSerializer(serializers.Serializer):
     email = serializers.EmailField()
 
     def validate(self, data):
-        if not User.objects.filter(email=data['email']).exists():
+        user = User.objects.filter(email=data['email']).first()
+        if user is None:
             raise exceptions.NotFound(
                 'Такого пользователя не существует')
-        if not User.objects.filter(password=data['password'],
-                                   email=data['email']).exists():
+        if not constant_time_compare(user.password, data['password']):
             raise exceptions.ParseError(
                 'Вы ввели неверный пароль')
+        data['user'] = user
         return data
 
 
@@ -95,13 +111,52 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         read_only_fields = ('__all__', )
 
 
+class RecipeFragmentSerializer(serializers.ModelSerializer):
+    """Сериалайзер для общей для всех пользователей части рецепта"""
+    tags = TagSerializer(many=True)
+    author = UserSerializer()
+    ingredients = IngredientRecipeSerializer(
+        many=True, source='ingredientrecipes')
+    image = RecipeImageField()
+
+    class Meta:
+        fields = ('id', 'tags', 'author', 'ingredients', 'name', 'image',
+                  'text', 'cooking_time')
+        model = Recipe
+
+
+def serialize_fragments(recipe_ids, context):
+    """Метод для построения общих частей рецептов сериалайзером
+
+    Эталон для build_fragments, который строит то же самое из values().
+    """
+    recipes = Recipe.objects.select_related('author').prefetch_related(
+        *get_recipe_prefetches()).in_bulk(recipe_ids)
+    serializer = RecipeFragmentSerializer(
+        recipes.values(), many=True, context=context)
+    return {fragment['id']: fragment for fragment in serializer.data}
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Сериалайзер для списка рецептов с общими частями из кэша"""
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, Manager) else data
+        return self.child.to_representation_many(list(recipes))
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
-    """Сериалайзер для просмотра рецептов"""
+    """Сериалайзер для просмотра рецептов
+
+    Общая для всех часть рецепта берётся из кэша, а при промахе строится
+    build_fragments из строк values(); к ней добавляются поля, зависящие
+    от пользователя.
+    """
     tags = TagSerializer(many=True)
     author = UserSubscribeSerializer()
     ingredients = IngredientRecipeSerializer(
         many=True, source='ingredientrecipes')
-    image = Base64ImageField()
+    image = RecipeImageField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -111,25 +166,80 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time')
         model = Recipe
         read_only_fields = ('__all__',)
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        result = self.to_representation_many([instance])
+        if not result:
+            raise exceptions.NotFound
+        return result[0]
+
+    def to_representation_many(self, recipes):
+        fragments = get_fragments(recipes, self.context, self.build_fragments)
+        result = []
+        for recipe in recipes:
+            fragment = fragments.get(recipe.id)
+            if fragment is None:
+                continue
+            data = OrderedDict()
+            for field in self._readable_fields:
+                name = field.field_name
+                if name == 'author':
+                    data[name] = dict(
+                        fragment[name],
+                        is_subscribed=self.get_author_is_subscribed(recipe))
+                elif name in fragment:
+                    data[name] = fragment[name]
+                else:
+                    data[name] = field.to_representation(
+                        field.get_attribute(recipe))
+            result.append(data)
+        return result
+
+    def build_fragments(self, recipe_ids):
+        return build_fragments(recipe_ids, self.context)
+
+    def get_author_is_subscribed(self, obj):
+        if hasattr(obj, 'author_is_subscribed'):
+            return obj.author_is_subscribed
+        if self.context['request'].user.is_anonymous:
+            return False
+        return Subscription.objects.filter(
+            user=self.context['request'].user,
+            author_id=obj.author_id).exists()
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         if self.context['request'].user.is_anonymous:
             return False
         return Favorite.objects.filter(user=self.context['request'].user,
                                        recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         if self.context['request'].user.is_anonymous:
             return False
         return Cart.objects.filter(user=self.context['request'].user,
                                    recipe=obj).exists()
 
 
+class RecipeMatchSerializer(RecipeReadSerializer):
+    """Сериалайзер для рецептов, подобранных по ингредиентам"""
+    matched_count = serializers.IntegerField(read_only=True)
+    missing_count = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + (
+            'matched_count', 'missing_count')
+
+
 class FavoriteSerializer(serializers.Serializer):
     """Сериалайзер для  избранного и списка покупок"""
     id = serializers.ReadOnlyField(source='recipe.id')
     name = serializers.ReadOnlyField(source='recipe.name')
-    image = serializers.ImageField(source='recipe.image')
+    image = RecipeImageField(variant='thumbnail', source='recipe.image')
     cooking_time = serializers.ReadOnlyField(source='recipe.cooking_time')
 
 
@@ -144,44 +254,88 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = '__all__'
         model = Recipe
 
+    def validate_tags(self, data):
+        try:
+            tags = [int(tag) for tag in data]
+        except (TypeError, ValueError):
+            raise exceptions.ParseError('id тэга должен быть целым числом')
+        if len(set(tags)) != len(tags):
+            raise exceptions.ParseError('Нельзя дублировать один тэг')
+        missing = set(tags) - Tag.objects.in_bulk(tags).keys()
+        if missing:
+            raise exceptions.ParseError(
+                f'Тэгов с id {sorted(missing)} не существует')
+        return tags
+
     def validate_ingredients(self, data):
         MIN_AMOUNT = 1
         ingredients = []
         for ingredient in data:
-            if int(ingredient.get('amount')) < MIN_AMOUNT:
+            try:
+                ingredient = {'id': int(ingredient.get('id')),
+                              'amount': int(ingredient.get('amount'))}
+            except (AttributeError, TypeError, ValueError):
+                raise exceptions.ParseError(
+                    'id и количество ингредиента должны быть целыми числами')
+            if ingredient['amount'] < MIN_AMOUNT:
                 raise exceptions.ParseError(
                     'Количество должно быть быть больше нуля')
-            if ingredient.get('id') in ingredients:
+            if ingredient['id'] in (item['id'] for item in ingredients):
                 raise exceptions.ParseError(
                     'Нельзя дублировать один ингридиент')
-            ingredients.append(ingredient.get('id'))
-        return data
+            ingredients.append(ingredient)
+        ids = [ingredient['id'] for ingredient in ingredients]
+        missing = set(ids) - Ingredient.objects.in_bulk(ids).keys()
+        if missing:
+            raise exceptions.ParseError(
+                f'Ингредиентов с id {sorted(missing)} не существует')
+        return ingredients
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
         create_tags_and_ingredient_recipe(tags, ingredients, recipe)
+        refresh_search_documents([recipe.id])
+        refresh_signatures([recipe.id])
+        schedule_index_update(recipe.id)
+        schedule_image_processing(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        super().update(instance, validated_data)
-        TagRecipe.objects.filter(recipe=instance).delete()
-        IngredientRecipe.objects.filter(recipe=instance).delete()
-        create_tags_and_ingredient_recipe(tags, ingredients, instance)
-        instance.save()
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=validated_data.keys())
+        transaction.on_commit(lambda: bump_version('recipe'))
+        transaction.on_commit(
+            lambda: bump_version(get_recipe_version(instance.id)))
+        schedule_image_processing(instance)
+        if tags is not None:
+            update_tag_recipe(tags, instance)
+        if ingredients is not None:
+            deltas = update_ingredient_recipe(ingredients, instance)
+            update_shopping_lists(get_cart_users(instance), deltas)
+        if ingredients is not None or 'text' in validated_data:
+            refresh_search_documents([instance.id])
+        if ingredients is not None or 'cooking_time' in validated_data:
+            schedule_index_update(instance.id)
+        if ingredients is not None or tags is not None:
+            refresh_signatures([instance.id])
         return instance
 
     def to_representation(self, instance):
         serializer = RecipeReadSerializer(
-            instance, context={'request': self.context['request']})
+            instance, context=self.context)
         return serializer.data
 
 
 class RecipeSubcribeSerializer(serializers.ModelSerializer):
     """Сериалайзер для  вывода рецептов в подписках"""
+    image = RecipeImageField(variant='thumbnail')
 
     class Meta:
         fields = ('id', 'name', 'image', 'cooking_time')
@@ -189,10 +343,17 @@ class RecipeSubcribeSerializer(serializers.ModelSerializer):
         read_only_fields = ('__all__',)
 
 
+class SimilarRecipeSerializer(RecipeSubcribeSerializer):
+    """Сериалайзер для вывода похожих рецептов"""
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSubcribeSerializer.Meta):
+        fields = RecipeSubcribeSerializer.Meta.fields + ('similarity',)
+
+
 class SubscribtionSerializer(UserSubscribeSerializer):
     """Сериалайзер для вывода подписок"""
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         fields = ('email', 'id', 'username',
@@ -202,6 +363,10 @@ class SubscribtionSerializer(UserSubscribeSerializer):
         read_only_fields = ('__all__',)
 
     def get_recipes(self, obj):
+        if hasattr(obj, 'recipes_preview'):
+            serializer = RecipeSubcribeSerializer(
+                obj.recipes_preview, many=True)
+            return serializer.data
         request = self.context['request']
         recipe_limit = request.GET.get('recipes_limit')
         if recipe_limit:
@@ -210,6 +375,3 @@ class SubscribtionSerializer(UserSubscribeSerializer):
             recipes = Recipe.objects.filter(author=obj)
         serializer = RecipeSubcribeSerializer(recipes, many=True)
         return serializer.data
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
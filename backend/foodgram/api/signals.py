@@ -0,0 +1,131 @@
+from django.db import connections, transaction
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            Tag, TagRecipe)
+from recipes.search import install_search_index
+from users.models import User
+from .authentication import (REVOKED_TOKENS_VERSION, get_user_version,
+                             revoked_tokens, user_cache)
+from .images import collect_image
+from .ingredient_index import ingredient_index
+from .recipe_index import schedule_index_update
+from .search import refresh_search_documents
+from .versions import bump_version, get_recipe_version
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+    transaction.on_commit(lambda: bump_version('ingredient'))
+
+
+@receiver(post_save, sender=Ingredient)
+def refresh_renamed_ingredient(sender, instance, created, **kwargs):
+    if not created:
+        refresh_search_documents(list(instance.recipes.values_list(
+            'recipe_id', flat=True)))
+
+
+@receiver(pre_delete, sender=Ingredient)
+def remember_ingredient_recipes(sender, instance, **kwargs):
+    instance._search_recipes = list(instance.recipes.values_list(
+        'recipe_id', flat=True))
+
+
+@receiver(post_delete, sender=Ingredient)
+def refresh_deleted_ingredient(sender, instance, **kwargs):
+    refresh_search_documents(instance.__dict__.pop('_search_recipes', ()))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version('tag'))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=TagRecipe)
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+@receiver((post_save, post_delete), sender=Favorite)
+def invalidate_recipes(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version('recipe'))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe_fragment(sender, instance, **kwargs):
+    version = get_recipe_version(instance.pk)
+    transaction.on_commit(lambda: bump_version(version))
+
+
+@receiver((post_save, post_delete), sender=TagRecipe)
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def invalidate_recipe_link_fragment(sender, instance, **kwargs):
+    version = get_recipe_version(instance.recipe_id)
+    transaction.on_commit(lambda: bump_version(version))
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_author_recipes(sender, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'password', 'last_login'}:
+        return
+    transaction.on_commit(lambda: bump_version('recipe'))
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_id = instance.pk
+    user_cache.invalidate(user_id)
+    transaction.on_commit(lambda: bump_version(get_user_version(user_id)))
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def revoke_token(sender, instance, **kwargs):
+    revoked_tokens.add(instance.token.jti)
+    transaction.on_commit(lambda: bump_version(REVOKED_TOKENS_VERSION))
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_replaced_image(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None or (
+            update_fields is not None and 'image' not in update_fields):
+        return
+    instance._replaced_image = Recipe.objects.filter(
+        pk=instance.pk).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def collect_replaced_image(sender, instance, **kwargs):
+    name = instance.__dict__.pop('_replaced_image', None)
+    if name and name != instance.image.name:
+        transaction.on_commit(lambda: collect_image(name))
+
+
+@receiver(post_delete, sender=Recipe)
+def collect_deleted_image(sender, instance, **kwargs):
+    name = instance.image.name
+    transaction.on_commit(lambda: collect_image(name))
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_deleted_recipe(sender, instance, **kwargs):
+    schedule_index_update(instance.id)
+
+
+@receiver(post_migrate)
+def restore_search_index(sender, app_config, using, plan=None, **kwargs):
+    # SQLite пересоздаёт таблицу при изменении схемы и теряет триггеры
+    if app_config.label != 'recipes' or not plan:
+        return
+    if not any(migration.app_label == 'recipes' and not backward
+               for migration, backward in plan):
+        return
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        columns = {column.name for column in (
+            connection.introspection.get_table_description(
+                cursor, Recipe._meta.db_table))}
+    if 'search_document' in columns:
+        install_search_index(connection)
@@ -0,0 +1,132 @@
+import hashlib
+import random
+from array import array
+
+from django.db import transaction
+from django.db.models import Count
+
+from recipes.models import (IngredientRecipe, Recipe, RecipeBucket,
+                            RecipeSignature, TagRecipe)
+from .utils import insert_rows
+
+MINHASH_PERMUTATIONS = 64
+# 16 полос по 4 строки: кандидатами становятся рецепты с Jaccard от ~0.5
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+SIMILAR_CANDIDATES = 200
+SIMILAR_LIMIT = 6
+
+_random = random.Random(0)
+HASH_COEFFICIENTS = tuple(
+    (_random.randrange(1, MERSENNE_PRIME), _random.randrange(MERSENNE_PRIME))
+    for _ in range(MINHASH_PERMUTATIONS))
+
+
+def hash_token(token):
+    return tuple(((a * token + b) % MERSENNE_PRIME) & MAX_HASH
+                 for a, b in HASH_COEFFICIENTS)
+
+
+def get_signature(tokens, hashes):
+    """Метод для MinHash-подписи множества токенов
+
+    hashes - общий для пачки рецептов кэш векторов хэшей токена, поэтому
+    подпись - это поэлементный минимум уже посчитанных векторов.
+    """
+    vectors = []
+    for token in tokens:
+        if token not in hashes:
+            hashes[token] = hash_token(token)
+        vectors.append(hashes[token])
+    return array('I', map(min, zip(*vectors)))
+
+
+def load_signature(value):
+    signature = array('I')
+    signature.frombytes(value)
+    return signature
+
+
+def get_bucket_keys(signature):
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(
+            bytes((band,)) + rows.tobytes(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'big', signed=True))
+    return keys
+
+
+def get_recipe_tokens(recipe_ids):
+    """Метод для множеств ингредиентов и тэгов рецептов в виде чисел"""
+    tokens = {recipe_id: [] for recipe_id in recipe_ids}
+    for recipe_id, ingredient_id in IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids).values_list(
+                'recipe_id', 'ingredient_id'):
+        tokens[recipe_id].append(ingredient_id * 2)
+    for recipe_id, tag_id in TagRecipe.objects.filter(
+            recipe_id__in=recipe_ids).values_list('recipe_id', 'tag_id'):
+        tokens[recipe_id].append(tag_id * 2 + 1)
+    return tokens
+
+
+def get_signature_rows(recipe_tokens, hashes):
+    """Метод для строк подписей и LSH-корзин по токенам рецептов"""
+    signatures = []
+    buckets = []
+    for recipe_id, tokens in recipe_tokens.items():
+        if not tokens:
+            continue
+        signature = get_signature(tokens, hashes)
+        signatures.append((recipe_id, signature.tobytes()))
+        buckets.extend((recipe_id, key) for key in get_bucket_keys(signature))
+    return signatures, buckets
+
+
+def refresh_signatures(recipe_ids, hashes=None):
+    """Метод для пересчёта подписей и LSH-корзин пачки рецептов
+
+    Строки рецептов блокируются до удаления старых подписей, поэтому
+    параллельные пересчёты одного рецепта, например первые запросы
+    похожих рецептов, выполняются по очереди и не конфликтуют по ключу.
+    """
+    hashes = {} if hashes is None else hashes
+    with transaction.atomic(savepoint=False):
+        recipe_ids = list(Recipe.objects.select_for_update().filter(
+            id__in=recipe_ids).order_by('id').values_list('id', flat=True))
+        signatures, buckets = get_signature_rows(
+            get_recipe_tokens(recipe_ids), hashes)
+        RecipeBucket.objects.filter(recipe_id__in=recipe_ids).delete()
+        RecipeSignature.objects.filter(recipe_id__in=recipe_ids).delete()
+        insert_rows(RecipeSignature, ('recipe', 'minhash'), signatures)
+        insert_rows(RecipeBucket, ('recipe', 'key'), buckets)
+
+
+def find_similar(recipe_id, limit=SIMILAR_LIMIT):
+    """Метод для поиска похожих рецептов по ингредиентам и тэгам
+
+    LSH-корзины отбирают кандидатов, у которых совпала хотя бы одна
+    полоса подписи; по полным подписям оценивается сходство Жаккара.
+    Возвращает пары (id рецепта, сходство) по убыванию сходства или
+    None, если подпись рецепта ещё не посчитана.
+    """
+    minhash = RecipeSignature.objects.filter(
+        recipe_id=recipe_id).values_list('minhash', flat=True).first()
+    if minhash is None:
+        return None
+    signature = load_signature(minhash)
+    candidates = RecipeBucket.objects.filter(
+        key__in=get_bucket_keys(signature)).exclude(
+            recipe_id=recipe_id).values('recipe_id').annotate(
+                bands=Count('id')).order_by('-bands', '-recipe_id')
+    candidate_ids = [candidate['recipe_id']
+                     for candidate in candidates[:SIMILAR_CANDIDATES]]
+    similar = []
+    for other_id, other in RecipeSignature.objects.filter(
+            recipe_id__in=candidate_ids).values_list('recipe_id', 'minhash'):
+        equal = sum(a == b for a, b in zip(signature, load_signature(other)))
+        similar.append((other_id, equal / MINHASH_PERMUTATIONS))
+    similar.sort(key=lambda item: (-item[1], -item[0]))
+    return similar[:limit]
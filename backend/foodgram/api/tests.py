@@ -0,0 +1,435 @@
+import base64
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.db.models import F
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from recipes.models import Ingredient, Recipe, ShoppingListItem, Tag
+from users.models import User
+from .fragments import build_fragments
+from .images import collect_image
+from .metrics import MetricsStore
+from .mixins import (get_cache_stats, record_cache_result,
+                     reset_cache_stats)
+from .query_plans import check_plan_case, get_plan_cases
+from .renderers import FastJSONRenderer
+from .seed import seed_dataset
+from .serializers import serialize_fragments
+from .utils import batched, update_shopping_lists
+from .versions import (VERSION_KEY, bump_version, get_cache,
+                       get_recipe_version)
+
+# Изображение 1x1 для создания рецептов
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAf'
+         'FcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==')
+
+
+class TemporaryMediaMixin:
+    """Загрузка файлов во временный MEDIA_ROOT"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+
+class CacheClearMixin:
+    """Очистка кэшей перед каждым тестом
+
+    Внутри TestCase колбэки on_commit не выполняются, поэтому версии
+    таблиц не меняются после записи, а id повторяются между тестами.
+    """
+
+    def setUp(self):
+        super().setUp()
+        for cache in caches.all():
+            cache.clear()
+
+
+def run_in_other_process(target, *args):
+    """Метод для вызова функции в другом процессе, как в другом воркере"""
+    process = multiprocessing.get_context('fork').Process(
+        target=target, args=args)
+    process.start()
+    process.join()
+
+
+def bump_in_other_process(name):
+    run_in_other_process(bump_version, name)
+
+
+class RecipeListQueryCountTest(CacheClearMixin, TestCase):
+    """Число запросов страницы рецептов не зависит от её размера
+
+    Без кэша: количество, страница и три запроса общих частей; с
+    общими частями в кэше остаются только количество и страница.
+    """
+    COLD_QUERIES = 5
+    WARM_QUERIES = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_dataset(users=5, recipes_per_author=6,
+                              ingredients=40)
+        cls.user = User.objects.get(id=seeded['users'][0])
+
+    def get_client(self, user):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        for user in (None, self.user):
+            for limit in (1, 20):
+                with self.subTest(user=user, limit=limit):
+                    for cache in caches.all():
+                        cache.clear()
+                    with self.assertNumQueries(self.COLD_QUERIES):
+                        response = self.get_client(user).get(
+                            f'/api/recipes/?limit={limit}')
+                    self.assertEqual(len(response.json()['results']), limit)
+
+    def test_cached_fragments_query_count(self):
+        client = self.get_client(self.user)
+        client.get('/api/recipes/?limit=20')
+        for limit in (1, 20):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(self.WARM_QUERIES):
+                    client.get(f'/api/recipes/?limit={limit}')
+
+
+class RecipeQueryBudgetTest(TemporaryMediaMixin, CacheClearMixin, TestCase):
+    """Бюджет запросов основных действий с рецептами
+
+    Числа не зависят от размера страницы и числа ингредиентов; при
+    их росте нужно искать потерянный prefetch или запрос в цикле.
+    """
+    LIST_QUERIES = 5
+    RETRIEVE_QUERIES = 4
+    CREATE_QUERIES = 31
+    PARTIAL_UPDATE_QUERIES = 34
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seeded = seed_dataset(users=5, recipes_per_author=6,
+                                  ingredients=40)
+        cls.user = User.objects.get(id=cls.seeded['users'][0])
+        cls.recipe_id = cls.user.recipes.order_by('id').values_list(
+            'id', flat=True).first()
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_payload(self, ingredients):
+        return {
+            'tags': self.seeded['tags'][:2],
+            'ingredients': [
+                {'id': ingredient_id, 'amount': 10}
+                for ingredient_id in self.seeded['ingredients'][:ingredients]],
+            'name': 'Рецепт',
+            'text': 'Описание рецепта',
+            'cooking_time': 15,
+        }
+
+    def test_list(self):
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_retrieve(self):
+        with self.assertNumQueries(self.RETRIEVE_QUERIES):
+            response = self.client.get(f'/api/recipes/{self.recipe_id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_create(self):
+        for ingredients in (1, 8):
+            with self.subTest(ingredients=ingredients):
+                with self.assertNumQueries(self.CREATE_QUERIES):
+                    response = self.client.post(
+                        '/api/recipes/',
+                        dict(self.get_payload(ingredients), image=IMAGE),
+                        format='json')
+                self.assertEqual(response.status_code, 201)
+
+    def test_partial_update(self):
+        with self.assertNumQueries(self.PARTIAL_UPDATE_QUERIES):
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe_id}/', self.get_payload(3),
+                format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+class QueryPlanTest(CacheClearMixin, TestCase):
+    """Планы основных запросов к рецептам на заполненной базе
+
+    Ни один запрос не сканирует таблицы связей целиком, не возвращает
+    дублирующиеся строки и не выходит за бюджет запросов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seeded = seed_dataset(users=30, recipes_per_author=10)
+
+    def test_query_plans(self):
+        for name, user, url in get_plan_cases(self.seeded):
+            with self.subTest(name):
+                self.assertEqual(check_plan_case(name, user, url), [])
+
+
+class RecipeFastPathTest(CacheClearMixin, TestCase):
+    """build_fragments строит рецепты байт в байт как сериалайзер
+
+    Вывод обоих рендереров сравнивается с JSONRenderer, включая
+    символы U+2028 и U+2029, которые он экранирует.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_dataset(users=6, recipes_per_author=5,
+                              ingredients=40)
+        cls.recipe_ids = sorted(seeded['recipes'])
+        Recipe.objects.filter(id__in=cls.recipe_ids[::2]).update(
+            image_processed=F('image'))
+        Recipe.objects.filter(id=cls.recipe_ids[0]).update(
+            name='Рецепт "в кавычках" \\ и\nперенос',
+            text='<b>&amp;</b> 😀 \u2028строка\u2029абзац')
+        Recipe.objects.filter(id=cls.recipe_ids[1]).update(image='')
+        Recipe.objects.get(id=cls.recipe_ids[2]).tags.clear()
+        User.objects.filter(id=seeded['users'][0]).update(
+            first_name='Имя "с кавычками"')
+
+    def test_fast_path_matches_serializer(self):
+        request = APIRequestFactory().get('/api/recipes/')
+        contexts = [{'request': request, 'image_variant': variant}
+                    for variant in ('card', 'full')] + [{}]
+        for context in contexts:
+            for size in (1, 6, 50):
+                for page in batched(self.recipe_ids, size):
+                    fast = build_fragments(page, context)
+                    reference = serialize_fragments(page, context)
+                    expected = JSONRenderer().render(
+                        [reference[recipe_id] for recipe_id in page])
+                    for renderer in (FastJSONRenderer(), JSONRenderer()):
+                        with self.subTest(
+                                variant=context.get('image_variant'),
+                                size=size, page=page[0],
+                                renderer=type(renderer).__name__):
+                            self.assertEqual(
+                                renderer.render([fast[recipe_id]
+                                                 for recipe_id in page]),
+                                expected)
+
+
+class RecipeFragmentCacheTest(CacheClearMixin, TestCase):
+    """Кэш общих частей рецептов сбрасывается записью в другом процессе"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_dataset(users=2, recipes_per_author=2, ingredients=10)
+        cls.user = User.objects.get(id=seeded['users'][0])
+        cls.recipe_id = seeded['recipes'][0]
+
+    def test_version_bump_in_other_process(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f'/api/recipes/{self.recipe_id}/'
+        self.assertNotEqual(client.get(url).json()['name'], 'Новое название')
+        Recipe.objects.filter(id=self.recipe_id).update(
+            name='Новое название')
+        bump_in_other_process(get_recipe_version(self.recipe_id))
+        self.assertEqual(client.get(url).json()['name'], 'Новое название')
+
+
+class ReferenceDataTest(CacheClearMixin, TestCase):
+    """Готовый список тэгов и ETag меняются после записи в другом процессе"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name='Завтрак', color='#E26C2D',
+                                     slug='breakfast')
+
+    def test_version_bump_in_other_process(self):
+        client = APIClient()
+        response = client.get('/api/tags/')
+        etag = response['ETag']
+        self.assertEqual(client.get(
+            '/api/tags/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Tag.objects.filter(id=self.tag.id).update(name='Обед')
+        bump_in_other_process('tag')
+        response = client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['name'], 'Обед')
+
+    def test_write_in_same_second(self):
+        cache = get_cache()
+        cache.set(VERSION_KEY.format('tag'), 1000.2, None)
+        client = APIClient()
+        last_modified = client.get('/api/tags/')['Last-Modified']
+        Tag.objects.filter(id=self.tag.id).update(name='Обед')
+        cache.set(VERSION_KEY.format('tag'), 1000.7, None)
+        response = client.get(
+            '/api/tags/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['name'], 'Обед')
+
+
+class ResponseCacheTest(CacheClearMixin, TestCase):
+    """Кэш ответов анонимам сбрасывается записью в другом процессе"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(users=2, recipes_per_author=2, ingredients=10)
+
+    def test_version_bump_in_other_process(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/recipes/')['X-Cache'], 'MISS')
+        self.assertEqual(client.get('/api/recipes/')['X-Cache'], 'HIT')
+        bump_in_other_process('recipe')
+        self.assertEqual(client.get('/api/recipes/')['X-Cache'], 'MISS')
+
+    def test_stats_are_shared_between_processes(self):
+        client = APIClient()
+        for _ in range(2):
+            client.get('/api/recipes/')
+        run_in_other_process(record_cache_result, 'hit')
+        self.assertEqual(get_cache_stats(), {'hit': 2, 'miss': 1})
+        run_in_other_process(reset_cache_stats)
+        self.assertEqual(get_cache_stats(), {'hit': 0, 'miss': 0})
+
+
+class ImageCollectTest(TemporaryMediaMixin, TestCase):
+    """Сборщик не удаляет файл, который переиспользует новая загрузка"""
+
+    def setUp(self):
+        super().setUp()
+        self.storage = Recipe._meta.get_field('image').storage
+        self.content = base64.b64decode(IMAGE.split(',')[1])
+        self.name = self.storage.save(
+            'recipes/image.png', ContentFile(self.content))
+        past = time.time() - 3600
+        os.utime(self.storage.path(self.name), (past, past))
+
+    def test_reused_file_is_kept(self):
+        name = self.storage.save(
+            'recipes/other.png', ContentFile(self.content))
+        self.assertEqual(name, self.name)
+        self.assertFalse(collect_image(self.name, grace=60))
+        self.assertTrue(self.storage.exists(self.name))
+
+    def test_stale_file_is_collected(self):
+        self.assertTrue(collect_image(self.name, grace=60))
+        self.assertFalse(self.storage.exists(self.name))
+        self.assertEqual(os.listdir(os.path.dirname(
+            self.storage.path(self.name))), [])
+
+
+class MetricsStoreTest(TestCase):
+    """Файлы завершившихся процессов переносятся в агрегат"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write_process_file(self, pid, value):
+        store = MetricsStore(self.directory)
+        store._path = os.path.join(self.directory, f'{pid}-1.json')
+        store.inc('foodgram_requests_total', (('view', 'test'),), value)
+        store.observe('foodgram_db_queries', (('view', 'test'),), 2)
+        store.flush()
+
+    def test_dead_process_files_are_folded(self):
+        process = subprocess.Popen(('true',))
+        process.wait()
+        self.write_process_file(process.pid, 3)
+        self.write_process_file(os.getpid(), 4)
+        store = MetricsStore(self.directory)
+        for _ in range(2):
+            totals = store.collect()
+            self.assertEqual(
+                totals[('foodgram_requests_total', (('view', 'test'),))], 7)
+            self.assertEqual(
+                totals[('foodgram_db_queries', (('view', 'test'),))][-1], 4)
+        self.assertNotIn(f'{process.pid}-1.json', os.listdir(self.directory))
+        self.assertIn('aggregate.json', os.listdir(self.directory))
+
+
+class RecipeSearchTest(CacheClearMixin, TestCase):
+    """Поиск упорядочен по релевантности в любом режиме пагинации"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            username='author', email='author@foodgram.local')
+        cls.ranked = [
+            Recipe.objects.create(
+                author=author, name=name, text=text, search_document=text,
+                image='recipes/image.png', cooking_time=10).id
+            for name, text in (('Суп дня', 'Простой обед'),
+                               ('Салат', 'Подаётся как суп'))]
+
+    def test_search_ignores_cursor_pagination(self):
+        client = APIClient()
+        for params in ('', '&pagination=cursor', '&cursor=bz0x'):
+            with self.subTest(params=params):
+                data = client.get(
+                    f'/api/recipes/?search=суп&limit=1{params}').json()
+                self.assertEqual(
+                    [recipe['id'] for recipe in data['results']],
+                    self.ranked[:1])
+                self.assertEqual(data['count'], 2)
+
+
+class UpdateShoppingListsTest(TestCase):
+    """Изменения списков покупок прибавляются к существующим строкам"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create(username=f'user{number}',
+                                email=f'user{number}@foodgram.local').id
+            for number in range(2)]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г').id
+            for number in range(3)]
+
+    def get_items(self):
+        return dict(((user_id, ingredient_id), amount)
+                    for user_id, ingredient_id, amount
+                    in ShoppingListItem.objects.values_list(
+                        'user_id', 'ingredient_id', 'amount'))
+
+    def test_update_shopping_lists(self):
+        first, second, third = self.ingredients
+        user, other = self.users
+        ShoppingListItem.objects.create(
+            user_id=user, ingredient_id=first, amount=5)
+        ShoppingListItem.objects.create(
+            user_id=user, ingredient_id=second, amount=3)
+        update_shopping_lists(
+            [user, other], {first: 10, second: -3, third: -1})
+        self.assertEqual(self.get_items(), {
+            (user, first): 15, (other, first): 10})
+        update_shopping_lists([user, user], {str(first): -15, second: 2})
+        self.assertEqual(self.get_items(), {
+            (user, second): 2, (other, first): 10})
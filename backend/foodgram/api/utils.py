@@ -1,15 +1,187 @@
-from django.shortcuts import get_object_or_404
+from itertools import islice
 
-from recipes.models import Ingredient, IngredientRecipe, Tag, TagRecipe
+from django.db import connections, router
+from django.db.models import (Count, F, IntegerField, OuterRef, Prefetch,
+                              Subquery, Sum, Window)
+from django.db.models.functions import Coalesce, RowNumber
+from rest_framework import exceptions
+
+from recipes.models import (Cart, IngredientRecipe, Recipe, ShoppingListItem,
+                            Tag, TagRecipe)
 
 
 def create_tags_and_ingredient_recipe(tags, ingredients, recipe):
     """Метод для создания объектов моделей TagRecipe и IngredientRecipe"""
     TagRecipe.objects.bulk_create(
-            [TagRecipe(tag=get_object_or_404(Tag, id=tag),
-             recipe=recipe) for tag in tags])
+            [TagRecipe(tag_id=tag, recipe=recipe) for tag in tags])
     IngredientRecipe.objects.bulk_create(
             [IngredientRecipe(
-                ingredient=get_object_or_404(Ingredient, id=ingredient['id']),
+                ingredient_id=ingredient['id'],
                 recipe=recipe,
                 amount=ingredient['amount']) for ingredient in ingredients])
+
+
+def update_tag_recipe(tags, recipe):
+    """Метод для изменения только отличающихся объектов TagRecipe"""
+    old_tags = set(TagRecipe.objects.filter(recipe=recipe).values_list(
+        'tag_id', flat=True))
+    if old_tags - set(tags):
+        TagRecipe.objects.filter(
+            recipe=recipe, tag_id__in=old_tags - set(tags)).delete()
+    TagRecipe.objects.bulk_create(
+        [TagRecipe(tag_id=tag, recipe=recipe)
+         for tag in tags if tag not in old_tags])
+
+
+def update_ingredient_recipe(ingredients, recipe):
+    """Метод для изменения только отличающихся объектов IngredientRecipe
+
+    Возвращает словарь {id ингредиента: изменение количества}.
+    """
+    amounts = {
+        ingredient['id']: ingredient['amount'] for ingredient in ingredients}
+    deltas = {}
+    to_update, to_delete = [], []
+    rows = IngredientRecipe.objects.filter(recipe=recipe)
+    for row in rows:
+        amount = amounts.pop(row.ingredient_id, None)
+        if amount is None:
+            to_delete.append(row.id)
+            deltas[row.ingredient_id] = -row.amount
+        elif amount != row.amount:
+            deltas[row.ingredient_id] = amount - row.amount
+            row.amount = amount
+            to_update.append(row)
+    if to_delete:
+        IngredientRecipe.objects.filter(id__in=to_delete).delete()
+    IngredientRecipe.objects.bulk_update(to_update, ('amount',))
+    IngredientRecipe.objects.bulk_create(
+        [IngredientRecipe(ingredient_id=ingredient, recipe=recipe,
+                          amount=amount)
+         for ingredient, amount in amounts.items()])
+    deltas.update(amounts)
+    return deltas
+
+
+def get_recipe_prefetches():
+    """Метод для получения Prefetch-объектов для вывода рецептов"""
+    return (
+        Prefetch('tags', queryset=Tag.objects.order_by('id')),
+        Prefetch('ingredientrecipes',
+                 queryset=IngredientRecipe.objects.select_related(
+                     'ingredient').order_by('id')))
+
+
+def set_recipes_preview(authors, recipes_limit=None):
+    """Метод для загрузки рецептов всех авторов страницы одним запросом"""
+    recipes = Recipe.objects.filter(author__in=authors).only(
+        'id', 'author_id', 'name', 'image', 'image_processed', 'cooking_time')
+    if recipes_limit:
+        sql, params = recipes.annotate(row_number=Window(
+            expression=RowNumber(), partition_by=[F('author_id')],
+            order_by=F('id').desc())).order_by().query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) preview WHERE preview.row_number <= %s '
+            'ORDER BY preview.author_id, preview.row_number',
+            (*params, int(recipes_limit)))
+    previews = {author.id: [] for author in authors}
+    for recipe in recipes:
+        previews[recipe.author_id].append(recipe)
+    for author in authors:
+        author.recipes_preview = previews[author.id]
+
+
+def get_recipe_amounts(recipe):
+    """Метод для получения количеств ингредиентов рецепта"""
+    return dict(IngredientRecipe.objects.filter(recipe=recipe).values_list(
+        'ingredient_id', 'amount'))
+
+
+def get_cart_users(recipe):
+    """Метод для получения пользователей, у которых рецепт в корзине"""
+    return list(Cart.objects.filter(recipe=recipe).values_list(
+        'user_id', flat=True))
+
+
+def update_shopping_lists(user_ids, deltas):
+    """Метод для изменения агрегированных списков покупок пользователей
+
+    deltas - словарь {id ингредиента: изменение количества}. Вызывается
+    внутри транзакции, в которой меняются корзины или рецепты. Изменения
+    прибавляются одним INSERT ... ON CONFLICT DO UPDATE, поэтому
+    параллельные записи одной ещё не созданной пары (пользователь,
+    ингредиент) не конфликтуют по уникальности; строки с неположительным
+    количеством затем удаляются.
+    """
+    deltas = {int(key): value for key, value in deltas.items() if value}
+    if not user_ids or not deltas:
+        return
+    user_ids = sorted(set(user_ids))
+    # Строки блокируются в одном порядке, чтобы не было взаимоблокировок
+    rows = [(user_id, ingredient_id, delta) for user_id in user_ids
+            for ingredient_id, delta in sorted(deltas.items())]
+    connection = connections[router.db_for_write(ShoppingListItem)]
+    table = connection.ops.quote_name(ShoppingListItem._meta.db_table)
+    insert_rows(
+        ShoppingListItem, ('user', 'ingredient', 'amount'), rows,
+        'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+        f'SET amount = {table}.amount + excluded.amount')
+    ShoppingListItem.objects.filter(
+        user__in=user_ids, ingredient__in=deltas, amount__lte=0).delete()
+
+
+def get_expected_shopping_lists(user_ids=None):
+    """Метод для расчёта списков покупок по корзинам с нуля"""
+    rows = IngredientRecipe.objects.filter(recipe__carts__isnull=False)
+    if user_ids is not None:
+        rows = rows.filter(recipe__carts__user__in=user_ids)
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in rows.values_list(
+            'recipe__carts__user', 'ingredient').annotate(
+                amount_sum=Sum('amount')).order_by().iterator()}
+
+
+def count_subquery(model, field):
+    """Метод для подсчёта связанных объектов коррелированным подзапросом"""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(count=Count('pk')).values('count')),
+        0, output_field=IntegerField())
+
+
+def batched(iterable, size):
+    """Метод для разбиения итерируемого объекта на списки по size штук"""
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def insert_rows(model, fields, rows, suffix=''):
+    """Метод для вставки строк многострочным INSERT без создания объектов
+
+    suffix дописывается к каждому запросу, например ON CONFLICT.
+    """
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    model_fields = [model._meta.get_field(field) for field in fields]
+    sql = (f'INSERT INTO {quote(model._meta.db_table)} '
+           f'({", ".join(quote(field.column) for field in model_fields)}) '
+           'VALUES ')
+    placeholder = f'({", ".join("%s" for _ in model_fields)})'
+    size = connection.ops.bulk_batch_size(model_fields, rows) or 1
+    with connection.cursor() as cursor:
+        for batch in batched(rows, size):
+            cursor.execute(
+                f'{sql}{", ".join(placeholder for _ in batch)} {suffix}',
+                [value for row in batch for value in row])
+
+
+def parse_number(value, name):
+    """Метод для проверки целочисленного параметра запроса"""
+    if not value.isdigit():
+        raise exceptions.ParseError(
+            f'Параметр {name} должен быть целым числом')
+    return int(value)
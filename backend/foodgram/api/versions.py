@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+VERSIONS_CACHE_ALIAS = getattr(settings, 'VERSIONS_CACHE_ALIAS', 'default')
+VERSION_KEY = 'foodgram:version:{}'
+
+
+def get_cache():
+    """Метод для получения кэша версий
+
+    Он должен быть общим для всех процессов: ключи кэшей в памяти
+    процессов строятся из версий, и только общая версия сообщает
+    процессу о записи, сделанной в другом.
+    """
+    return caches[VERSIONS_CACHE_ALIAS]
+
+
+def get_recipe_version(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def get_version(name):
+    """Метод для получения версии таблицы (время последней записи)"""
+    cache = get_cache()
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Метод для смены версии таблицы после записи в неё"""
+    version = time.time()
+    get_cache().set(VERSION_KEY.format(name), version, None)
+    return version
+
+
+def get_versions(names):
+    """Метод для получения версий нескольких таблиц за одно обращение"""
+    cache = get_cache()
+    keys = {name: VERSION_KEY.format(name) for name in names}
+    versions = cache.get_many(keys.values())
+    missing = [key for key in keys.values() if key not in versions]
+    if missing:
+        now = time.time()
+        for key in missing:
+            cache.add(key, now, None)
+        versions.update(cache.get_many(missing))
+    return {name: versions.get(key) for name, key in keys.items()}
@@ -1,5 +1,8 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from functools import partial
+
+from django.db import transaction
+from django.db.models import BooleanField, Exists, F, OuterRef, Value
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
@@ -8,19 +11,31 @@ from rest_framework.permissions import (AllowAny, IsAuthenticated,
 from rest_framework_simplejwt.tokens import SlidingToken
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework import filters, status, viewsets
+from rest_framework import exceptions, filters, status, viewsets
 
-from recipes.models import (Cart, Favorite, Ingredient, IngredientRecipe,
-                            Recipe, Tag)
+from recipes.models import Cart, Favorite, Ingredient, Recipe, Tag
 from users.models import Subscription, User
+from .exporters import EXPORTERS, chunked, get_shopping_list, iterate_rows
+from .feed import (backfill_timeline, fan_out_recipe, get_feed_ids,
+                   prune_timeline)
 from .filters import IngredientFilter, RecipeFilter
-from .mixins import GetPostViewSet
-from .paginators import RecipePagination
+from .ingredient_index import ingredient_index
+from .mixins import (GetPostViewSet, ReferenceDataMixin,
+                     ResponseCacheMixin)
+from .paginators import (FeedPagination, RecipeMatchPagination,
+                         RecipePagination)
 from .permissions import RecipePermission
+from .recipe_index import recipe_index
+from .similarity import SIMILAR_LIMIT, find_similar, refresh_signatures
+from .renderers import CSVRenderer, PDFRenderer, TxtRenderer
+from .utils import (get_cart_users, get_recipe_amounts,
+                    get_recipe_prefetches, parse_number, set_recipes_preview,
+                    update_shopping_lists)
 from .serializers import (ChangePasswordSerializer, FavoriteSerializer,
                           IngredientSerializer,
                           JWTTokenSerializer, RecipeSerializer,
-                          RecipeReadSerializer, SubscribtionSerializer,
+                          RecipeMatchSerializer, RecipeReadSerializer,
+                          SimilarRecipeSerializer, SubscribtionSerializer,
                           TagSerializer, UserSerializer,
                           UserSubscribeSerializer)
 
@@ -47,9 +62,13 @@ class UserViewSet(GetPostViewSet):
     @action(detail=False, methods=('get',),
             url_name='subscriptions', permission_classes=(IsAuthenticated,))
     def subscriptions(self, request, *args, **kwargs):
-        queryset = User.objects.filter(content_maker__user=request.user.id)
+        queryset = User.objects.filter(
+            content_maker__user=request.user.id).annotate(
+                is_subscribed=Value(True, output_field=BooleanField())
+        ).order_by('-id')
         page = self.paginate_queryset(queryset)
         if page is not None:
+            set_recipes_preview(page, request.GET.get('recipes_limit'))
             serializer = SubscribtionSerializer(
                 page, many=True, context={'request': request},)
             return self.get_paginated_response(serializer.data)
@@ -61,7 +80,7 @@ class UserViewSet(GetPostViewSet):
                                               context={'request': request})
         serializer.is_valid(raise_exception=True)
         request.user.password = serializer.data['new_password']
-        request.user.save()
+        request.user.save(update_fields=('password',))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -73,10 +92,7 @@ class APIToken(APIView):
     def post(self, request):
         serializer = JWTTokenSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        user = get_object_or_404(
-            User, password=serializer.data['password'],
-            email=serializer.data['email'])
-        token = SlidingToken.for_user(user)
+        token = SlidingToken.for_user(serializer.validated_data['user'])
         return Response(
                 {'auth_token': str(token)}, status=status.HTTP_200_OK)
 
@@ -93,6 +109,7 @@ class DeleteToken(APIView):
 class SubscriptionView(APIView):
     """Вьюкласс для подписки"""
 
+    @transaction.atomic
     def post(self, request, user_id):
         author = get_object_or_404(User, id=user_id)
         if author == request.user:
@@ -105,10 +122,16 @@ class SubscriptionView(APIView):
                 {'error': 'Вы уже подписаны на этого автора'},
                 status=status.HTTP_400_BAD_REQUEST)
         Subscription.objects.create(user=request.user, author=author)
+        User.objects.filter(id=author.id).update(
+            followers_count=F('followers_count') + 1)
+        backfill_timeline(request.user, author)
+        author.is_subscribed = True
+        set_recipes_preview([author], request.GET.get('recipes_limit'))
         serializer = SubscribtionSerializer(author,
                                             context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete(self, request, user_id):
         author = get_object_or_404(User, id=user_id)
         deleted_subscribtion = Subscription.objects.filter(user=request.user,
@@ -118,12 +141,16 @@ class SubscriptionView(APIView):
                 {'error': 'Вы не подписаны на этого автора'},
                 status=status.HTTP_400_BAD_REQUEST)
         deleted_subscribtion.delete()
+        User.objects.filter(id=author.id).update(
+            followers_count=F('followers_count') - 1)
+        prune_timeline(request.user, author)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceDataMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для работы с ингредиентами"""
 
+    reference_name = 'ingredient'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
@@ -131,60 +158,181 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (filters.SearchFilter, DjangoFilterBackend)
     filterset_class = IngredientFilter
 
-
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+    def get_list_response(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().get_list_response(request, *args, **kwargs)
+        limit = request.query_params.get('limit')
+        if limit is not None:
+            if not limit.isdigit():
+                raise exceptions.ParseError(
+                    'Параметр limit должен быть целым числом')
+            limit = int(limit)
+        return Response(ingredient_index.search(name, limit),
+                        status=status.HTTP_200_OK)
+
+
+class TagViewSet(ReferenceDataMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для работы с тэгами"""
 
+    reference_name = 'tag'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ResponseCacheMixin, viewsets.ModelViewSet):
     """Вьюсет для работы с рецептами"""
 
+    cache_versions = ('recipe', 'tag', 'ingredient')
     queryset = Recipe.objects.all()
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (IsAuthenticatedOrReadOnly, RecipePermission)
     pagination_class = RecipePagination
 
+    def get_queryset(self):
+        user = self.request.user
+        if self.action in ('list', 'retrieve', 'feed', 'what_to_cook'):
+            # Остальные поля сериалайзер берёт из кэша частей рецептов
+            queryset = self.queryset.only('id', 'author_id')
+        else:
+            queryset = self.queryset.select_related(
+                'author').prefetch_related(
+                    *get_recipe_prefetches()).defer('search_document')
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+                author_is_subscribed=Value(
+                    False, output_field=BooleanField()))
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(Cart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            author_is_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('author'))))
+
     def get_serializer_class(self):
         if self.action == 'create' or self.action == 'partial_update':
             return RecipeSerializer
         return RecipeReadSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['image_variant'] = (
+            'card' if self.action in ('list', 'feed', 'what_to_cook')
+            else 'full')
+        return context
+
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        User.objects.filter(id=self.request.user.id).update(
+            recipes_count=F('recipes_count') + 1)
+        fan_out_recipe(recipe)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        update_shopping_lists(
+            get_cart_users(instance),
+            {ingredient: -amount for ingredient, amount
+             in get_recipe_amounts(instance).items()})
+        instance.delete()
+        User.objects.filter(id=instance.author_id).update(
+            recipes_count=F('recipes_count') - 1)
 
     @action(detail=False, methods=('get',),
             url_name='download_shopping_cart',
-            permission_classes=(IsAuthenticated,))
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=(TxtRenderer, CSVRenderer, PDFRenderer))
     def download_shopping_cart(self, request, *args, **kwargs):
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__carts__user=self.request.user).values(
-                'ingredient__name', 'ingredient__measurement_unit').annotate(
-                    amount_sum=Sum('amount')).order_by('ingredient__name')
-        file_content = 'СПИСОК ПОКУПОК \n \n'
-        number_line = 0
-        for ingredient in ingredients:
-            number_line += 1
-            file_content += (
-                f"{number_line}. {ingredient.get('ingredient__name')} "
-                f"({ingredient.get('ingredient__measurement_unit')}) - "
-                f"{ingredient.get('amount_sum')} \n")
-        file_content += '\nУдачных покупок и приятного аппетита! Ваш foodgram'
-
-        return HttpResponse(
-            file_content, content_type='text/plain, charset=utf8',
+        file_format = request.accepted_renderer.format
+        exporter, content_type = EXPORTERS[file_format]
+        rows = iterate_rows(get_shopping_list(request.user))
+        response = StreamingHttpResponse(
+            chunked(exporter(rows)), content_type=content_type,
             status=status.HTTP_200_OK)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{file_format}"')
+        return response
+
+    @action(detail=False, methods=('get',), url_name='feed',
+            permission_classes=(IsAuthenticated,),
+            pagination_class=FeedPagination)
+    def feed(self, request, *args, **kwargs):
+        ids = self.paginate_queryset(partial(get_feed_ids, request.user))
+        recipes = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id in ids if recipe_id in recipes],
+            many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=('get',), url_name='what_to_cook',
+            permission_classes=(AllowAny,),
+            pagination_class=RecipeMatchPagination)
+    def what_to_cook(self, request, *args, **kwargs):
+        params = request.query_params
+        ingredients = [parse_number(value, 'ingredients')
+                       for value in params.getlist('ingredients')]
+        if not ingredients:
+            raise exceptions.ParseError('Не указаны ингредиенты')
+        limits = {name: parse_number(params[name], name)
+                  for name in ('max_missing', 'cooking_time')
+                  if name in params}
+        page = self.paginate_queryset(
+            recipe_index.match(ingredients, **limits))
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page])
+        result = []
+        for recipe_id, matched, missing in page:
+            # Индекс другого процесса может ещё помнить удалённый рецепт
+            if recipe_id in recipes:
+                recipe = recipes[recipe_id]
+                recipe.matched_count = matched
+                recipe.missing_count = missing
+                result.append(recipe)
+        serializer = RecipeMatchSerializer(
+            result, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=('get',), url_name='similar',
+            permission_classes=(AllowAny,))
+    def similar(self, request, pk=None):
+        limit = parse_number(
+            request.query_params.get('limit', str(SIMILAR_LIMIT)), 'limit')
+        similar = find_similar(pk, limit)
+        if similar is None:
+            recipe = get_object_or_404(Recipe.objects.only('id'), pk=pk)
+            refresh_signatures([recipe.id])
+            similar = find_similar(recipe.id, limit) or []
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'image_processed',
+            'cooking_time').in_bulk([recipe_id for recipe_id, _ in similar])
+        result = []
+        for recipe_id, similarity in similar:
+            if recipe_id in recipes:
+                recipes[recipe_id].similarity = similarity
+                result.append(recipes[recipe_id])
+        serializer = SimilarRecipeSerializer(
+            result, many=True, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 class FavoriteView(APIView):
     """Вьюкласс для избранного"""
     MODEL = Favorite
+    COUNTER = 'favorites_count'
 
+    def recipe_added(self, user, recipe):
+        pass
+
+    def recipe_removed(self, user, recipe):
+        pass
+
+    @transaction.atomic
     def post(self, request, recipe_id):
         recipe = get_object_or_404(Recipe, id=recipe_id)
         if self.MODEL.objects.filter(
@@ -193,9 +341,13 @@ class FavoriteView(APIView):
                 {'error': 'Вы уже добавили этот рецепт'},
                 status=status.HTTP_400_BAD_REQUEST)
         favorite = self.MODEL.objects.create(user=request.user, recipe=recipe)
+        Recipe.objects.filter(id=recipe.id).update(
+            **{self.COUNTER: F(self.COUNTER) + 1})
+        self.recipe_added(request.user, recipe)
         serializer = FavoriteSerializer(favorite)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete(self, request, recipe_id):
         recipe = get_object_or_404(Recipe, id=recipe_id)
         deleted = self.MODEL.objects.filter(
@@ -205,9 +357,21 @@ class FavoriteView(APIView):
                 {'error': 'У вас нет этого рецепта'},
                 status=status.HTTP_400_BAD_REQUEST)
         deleted.delete()
+        Recipe.objects.filter(id=recipe.id).update(
+            **{self.COUNTER: F(self.COUNTER) - 1})
+        self.recipe_removed(request.user, recipe)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class CartView(FavoriteView):
     """Вьюкласс для списка покупок"""
     MODEL = Cart
+    COUNTER = 'carts_count'
+
+    def recipe_added(self, user, recipe):
+        update_shopping_lists([user.id], get_recipe_amounts(recipe))
+
+    def recipe_removed(self, user, recipe):
+        update_shopping_lists(
+            [user.id], {ingredient: -amount for ingredient, amount
+                        in get_recipe_amounts(recipe).items()})
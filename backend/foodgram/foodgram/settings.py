@@ -1,4 +1,5 @@
 import os
+import tempfile
 from datetime import timedelta
 from dotenv import load_dotenv
 
@@ -31,6 +32,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,6 +73,40 @@ DATABASES = {
         'PORT': os.getenv('DB_PORT', '5432')
     }
 }
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 20000)),
+        },
+    },
+    # Версии таблиц и рецептов, от которых зависят ключи кэшей. Кэш
+    # обязан быть общим для всех процессов: иначе запись в одном воркере
+    # не сбрасывает кэш остальных. По умолчанию это файлы на диске, общие
+    # для воркеров одного контейнера; для нескольких хостов нужен
+    # memcached или другой сетевой кэш.
+    'versions': {
+        'BACKEND': os.getenv(
+            'VERSIONS_CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv(
+            'VERSIONS_CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram-versions')),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('VERSIONS_CACHE_MAX_ENTRIES',
+                                         200000)),
+        },
+    },
+}
+VERSIONS_CACHE_ALIAS = 'versions'
+
+METRICS_DIR = os.getenv(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram-metrics'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -109,12 +145,15 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication', ],
+        'api.authentication.CachedJWTAuthentication', ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer', ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6, }
 
 SIMPLE_JWT = {
-    'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.SlidingToken',),
+    'AUTH_TOKEN_CLASSES': ('api.authentication.CachedSlidingToken',),
     'SLIDING_TOKEN_LIFETIME': timedelta(days=5),
     'AUTH_HEADER_TYPES': ('Token',),
 }
@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 from .models import (Cart, Favorite, Ingredient, IngredientRecipe,
-                     Recipe, Tag, TagRecipe)
+                     Recipe, ShoppingListItem, Tag, TagRecipe)
 
 
 class IngredientRecipeInline(admin.TabularInline):
@@ -27,12 +27,9 @@ class RecipeAdmin(admin.ModelAdmin):
     fieldsets = (
         ('Main params', {'fields': (
             'name', 'author', 'image', 'text', 'cooking_time')}),
-        ('Added to favorite', {'fields': ('favorite_count',)})
+        ('Added to favorite', {'fields': ('favorites_count',)})
         )
-    readonly_fields = ('favorite_count',)
-
-    def favorite_count(self, obj):
-        return obj.favorites.count()
+    readonly_fields = ('favorites_count',)
 
 
 admin.site.register(Tag)
@@ -40,3 +37,4 @@ admin.site.register(IngredientRecipe)
 admin.site.register(TagRecipe)
 admin.site.register(Cart)
 admin.site.register(Favorite)
+admin.site.register(ShoppingListItem)
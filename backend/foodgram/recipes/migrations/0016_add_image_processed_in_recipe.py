@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_add_uniqueconstraint_in_ingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_processed',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='Recipe_image_processed'),
+        ),
+    ]
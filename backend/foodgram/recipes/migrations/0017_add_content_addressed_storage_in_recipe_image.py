@@ -0,0 +1,19 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:51
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_add_image_processed_in_recipe'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(db_index=True, storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes/', verbose_name='Recipe_image'),
+        ),
+    ]
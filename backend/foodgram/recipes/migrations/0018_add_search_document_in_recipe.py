@@ -0,0 +1,45 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+from recipes.search import install_search_index, uninstall_search_index
+
+
+def fill_search_documents(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    names = {}
+    for recipe_id, name in IngredientRecipe.objects.order_by(
+            'recipe_id', 'ingredient__name').values_list(
+                'recipe_id', 'ingredient__name'):
+        names.setdefault(recipe_id, []).append(name)
+    recipes = list(Recipe.objects.only('id', 'text'))
+    for recipe in recipes:
+        recipe.search_document = ' '.join(
+            (recipe.text, *names.get(recipe.id, ())))
+    Recipe.objects.bulk_update(recipes, ('search_document',), 500)
+
+
+def install(apps, schema_editor):
+    install_search_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_add_content_addressed_storage_in_recipe_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False, verbose_name='Recipe_search_document'),
+        ),
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(install, uninstall),
+    ]
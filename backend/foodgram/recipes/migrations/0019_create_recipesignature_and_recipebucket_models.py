@@ -0,0 +1,37 @@
+# Generated by Django 2.2.19 on 2026-10-18 18:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0018_add_search_document_in_recipe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSignature',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='recipes.Recipe', verbose_name='Signature_recipe')),
+                ('minhash', models.BinaryField(verbose_name='Minhash')),
+            ],
+            options={
+                'verbose_name': 'Recipe_signature',
+                'verbose_name_plural': 'Recipe_signatures',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField(db_index=True, verbose_name='Bucket_key')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='recipes.Recipe', verbose_name='Bucket_recipe')),
+            ],
+            options={
+                'verbose_name': 'Recipe_bucket',
+                'verbose_name_plural': 'Recipe_buckets',
+            },
+        ),
+    ]
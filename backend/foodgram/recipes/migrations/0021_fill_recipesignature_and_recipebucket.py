@@ -0,0 +1,89 @@
+# Generated by Django 2.2.19 on 2026-10-18 21:40
+
+import hashlib
+import random
+from array import array
+
+from django.db import migrations
+
+# Копия параметров и хэширования api.similarity на момент миграции: их
+# последующие изменения не должны менять уже применённую миграцию, а
+# подписи после таких изменений пересчитывает rebuild_similarity_index
+BATCH_SIZE = 500
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+_random = random.Random(0)
+HASH_COEFFICIENTS = tuple(
+    (_random.randrange(1, MERSENNE_PRIME), _random.randrange(MERSENNE_PRIME))
+    for _ in range(MINHASH_PERMUTATIONS))
+
+
+def get_signature(tokens, hashes):
+    vectors = []
+    for token in tokens:
+        if token not in hashes:
+            hashes[token] = tuple(
+                ((a * token + b) % MERSENNE_PRIME) & MAX_HASH
+                for a, b in HASH_COEFFICIENTS)
+        vectors.append(hashes[token])
+    return array('I', map(min, zip(*vectors)))
+
+
+def get_bucket_keys(signature):
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(
+            bytes((band,)) + rows.tobytes(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'big', signed=True))
+    return keys
+
+
+def fill_signatures(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    TagRecipe = apps.get_model('recipes', 'TagRecipe')
+    RecipeSignature = apps.get_model('recipes', 'RecipeSignature')
+    RecipeBucket = apps.get_model('recipes', 'RecipeBucket')
+    RecipeBucket.objects.all().delete()
+    RecipeSignature.objects.all().delete()
+    recipe_ids = list(Recipe.objects.order_by('id').values_list(
+        'id', flat=True))
+    hashes = {}
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        batch = recipe_ids[start:start + BATCH_SIZE]
+        tokens = {recipe_id: [] for recipe_id in batch}
+        for recipe_id, ingredient_id in IngredientRecipe.objects.filter(
+                recipe_id__in=batch).values_list(
+                    'recipe_id', 'ingredient_id'):
+            tokens[recipe_id].append(ingredient_id * 2)
+        for recipe_id, tag_id in TagRecipe.objects.filter(
+                recipe_id__in=batch).values_list('recipe_id', 'tag_id'):
+            tokens[recipe_id].append(tag_id * 2 + 1)
+        signatures = []
+        buckets = []
+        for recipe_id, recipe_tokens in tokens.items():
+            if not recipe_tokens:
+                continue
+            signature = get_signature(recipe_tokens, hashes)
+            signatures.append(RecipeSignature(
+                recipe_id=recipe_id, minhash=signature.tobytes()))
+            buckets.extend(RecipeBucket(recipe_id=recipe_id, key=key)
+                           for key in get_bucket_keys(signature))
+        RecipeSignature.objects.bulk_create(signatures, BATCH_SIZE)
+        RecipeBucket.objects.bulk_create(buckets, BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0020_create_timelineentry_model_and_add_fanned_out_in_recipe'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_signatures, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,7 @@ from django.core.validators import MinValueValidator
 from django.db import models
 
 from users.models import User
+from .storage import ContentAddressedStorage
 
 MINIMAL_VALUE = 1
 
@@ -14,6 +15,9 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ingredient'
         verbose_name_plural = 'Ingredients'
+        constraints = [models.UniqueConstraint(
+                       fields=['name', 'measurement_unit'],
+                       name='unique_ingredient')]
 
     def __str__(self):
         return self.name
@@ -46,7 +50,10 @@ class Recipe(models.Model):
         verbose_name='Recipe_author')
     name = models.CharField('Recipe_name', blank=False, max_length=200)
     image = models.ImageField(
-        'Recipe_image', upload_to='recipes/', blank=False)
+        'Recipe_image', upload_to='recipes/', blank=False, db_index=True,
+        storage=ContentAddressedStorage())
+    image_processed = models.CharField(
+        'Recipe_image_processed', max_length=100, blank=True, editable=False)
     text = models.TextField('Recipe_text', blank=False)
     cooking_time = models.IntegerField(
         'Cooking_time', blank=False,
@@ -54,6 +61,14 @@ class Recipe(models.Model):
             MINIMAL_VALUE,
             f'Время приготовления должно быть не меньше {MINIMAL_VALUE}'
             ' минуты'),),)
+    favorites_count = models.PositiveIntegerField(
+        'Favorites_count', default=0, editable=False)
+    carts_count = models.PositiveIntegerField(
+        'Carts_count', default=0, editable=False)
+    search_document = models.TextField(
+        'Recipe_search_document', blank=True, editable=False)
+    fanned_out = models.BooleanField(
+        'Recipe_fanned_out', default=False, editable=False)
 
     class Meta:
         ordering = ('-id',)
@@ -141,3 +156,83 @@ class Cart(models.Model):
 
     def __str__(self):
         return f'{self.user} add to cart {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """Модель агрегированного списка покупок"""
+    user = models.ForeignKey(User,
+                             related_name="shopping_list",
+                             on_delete=models.CASCADE,
+                             verbose_name="Shopping_list_user")
+    ingredient = models.ForeignKey(Ingredient,
+                                   related_name="shopping_list_items",
+                                   on_delete=models.CASCADE,
+                                   verbose_name="Shopping_list_ingredient")
+    amount = models.IntegerField('Amount')
+
+    class Meta:
+        verbose_name = "Shopping_list_item"
+        verbose_name_plural = "Shopping_list_items"
+        constraints = [models.UniqueConstraint(fields=['user', 'ingredient'],
+                       name='unique_shopping_list_item')]
+
+    def __str__(self):
+        return f'{self.user} needs {self.amount} of {self.ingredient}'
+
+
+class RecipeSignature(models.Model):
+    """Модель MinHash-подписей рецептов по ингредиентам и тэгам"""
+    recipe = models.OneToOneField(Recipe,
+                                  primary_key=True,
+                                  related_name="signature",
+                                  on_delete=models.CASCADE,
+                                  verbose_name="Signature_recipe")
+    minhash = models.BinaryField('Minhash')
+
+    class Meta:
+        verbose_name = "Recipe_signature"
+        verbose_name_plural = "Recipe_signatures"
+
+    def __str__(self):
+        return f'Signature of {self.recipe}'
+
+
+class RecipeBucket(models.Model):
+    """Модель LSH-корзин MinHash-подписей рецептов"""
+    recipe = models.ForeignKey(Recipe,
+                               related_name="buckets",
+                               on_delete=models.CASCADE,
+                               verbose_name="Bucket_recipe")
+    key = models.BigIntegerField('Bucket_key', db_index=True)
+
+    class Meta:
+        verbose_name = "Recipe_bucket"
+        verbose_name_plural = "Recipe_buckets"
+
+    def __str__(self):
+        return f'{self.recipe} in bucket {self.key}'
+
+
+class TimelineEntry(models.Model):
+    """Модель ленты подписок, заполняемой при публикации рецепта"""
+    user = models.ForeignKey(User,
+                             related_name="timeline",
+                             on_delete=models.CASCADE,
+                             verbose_name="Timeline_user")
+    recipe = models.ForeignKey(Recipe,
+                               related_name="timeline_entries",
+                               on_delete=models.CASCADE,
+                               verbose_name="Timeline_recipe")
+    author = models.ForeignKey(User,
+                               related_name="+",
+                               on_delete=models.CASCADE,
+                               verbose_name="Timeline_author")
+
+    class Meta:
+        verbose_name = "Timeline_entry"
+        verbose_name_plural = "Timeline_entries"
+        constraints = [models.UniqueConstraint(fields=['user', 'recipe'],
+                       name='unique_timeline_entry')]
+
+    def __str__(self):
+        return f'{self.recipe} in timeline of {self.user}'
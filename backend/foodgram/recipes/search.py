@@ -0,0 +1,67 @@
+SEARCH_CONFIG = 'russian'
+SEARCH_TABLE = 'recipes_recipe_search'
+# Название рецепта весит больше описания и ингредиентов
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('{config}', {table}name), 'A') || "
+    "setweight(to_tsvector('{config}', {table}search_document), 'B')")
+
+POSTGRESQL_INSTALL = (
+    f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_idx ON recipes_recipe '
+    f'USING GIN (({SEARCH_VECTOR.format(config=SEARCH_CONFIG, table="")}))',
+)
+POSTGRESQL_UNINSTALL = (f'DROP INDEX IF EXISTS {SEARCH_TABLE}_idx',)
+
+SQLITE_INSTALL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    "name, search_document, content='recipes_recipe', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    f'CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert '
+    f'AFTER INSERT ON recipes_recipe BEGIN '
+    f'INSERT INTO {SEARCH_TABLE}(rowid, name, search_document) '
+    f'VALUES (new.id, new.name, new.search_document); END',
+    f'CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete '
+    f'AFTER DELETE ON recipes_recipe BEGIN '
+    f'INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, name, '
+    f"search_document) VALUES ('delete', old.id, old.name, "
+    f'old.search_document); END',
+    f'CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update '
+    f'AFTER UPDATE OF name, search_document ON recipes_recipe BEGIN '
+    f'INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, name, '
+    f"search_document) VALUES ('delete', old.id, old.name, "
+    f'old.search_document); '
+    f'INSERT INTO {SEARCH_TABLE}(rowid, name, search_document) '
+    f'VALUES (new.id, new.name, new.search_document); END',
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')",
+)
+SQLITE_UNINSTALL = (
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_update',
+    f'DROP TABLE IF EXISTS {SEARCH_TABLE}',
+)
+
+
+def execute_all(connection, statements):
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def install_search_index(connection):
+    """Метод для создания полнотекстового индекса рецептов
+
+    На PostgreSQL это GIN-индекс по взвешенному tsvector, на SQLite -
+    теневая таблица FTS5 с триггерами. Повторный вызов безопасен.
+    """
+    if connection.vendor == 'postgresql':
+        execute_all(connection, POSTGRESQL_INSTALL)
+    elif connection.vendor == 'sqlite':
+        execute_all(connection, SQLITE_INSTALL)
+
+
+def uninstall_search_index(connection):
+    """Метод для удаления полнотекстового индекса рецептов"""
+    if connection.vendor == 'postgresql':
+        execute_all(connection, POSTGRESQL_UNINSTALL)
+    elif connection.vendor == 'sqlite':
+        execute_all(connection, SQLITE_UNINSTALL)
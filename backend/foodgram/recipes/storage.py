@@ -0,0 +1,58 @@
+import hashlib
+import os
+import posixpath
+import time
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, которое называет файлы по sha256 их содержимого
+
+    Повторная загрузка тех же байтов возвращает уже сохранённый файл
+    и не пишет его на диск заново, а только обновляет время его
+    изменения, чтобы сборщик неиспользуемых файлов его не удалил.
+    """
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        name = posixpath.join(
+            posixpath.dirname(name),
+            digest.hexdigest() + posixpath.splitext(name)[1].lower())
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return super().save(name, content, max_length)
+        return name
+
+
+def delete_if_stale(storage, name, grace):
+    """Метод для удаления файла, не изменявшегося grace секунд
+
+    Файл сначала переименовывается, а затем его время изменения
+    проверяется снова: если загрузка тех же байтов успела его обновить,
+    файл возвращается на место; если она пришла после переименования,
+    то запишет файл заново. Возвращает True, если файл удалён.
+    """
+    path = storage.path(name)
+    removed = f'{path}.{uuid.uuid4().hex}.removed'
+    try:
+        if time.time() - os.stat(path).st_mtime < grace:
+            return False
+        os.rename(path, removed)
+    except FileNotFoundError:
+        return False
+    if time.time() - os.stat(removed).st_mtime < grace:
+        os.replace(removed, path)
+        return False
+    os.remove(removed)
+    return True
@@ -7,6 +7,10 @@ class User (AbstractUser):
     email = models.EmailField('E-mail', unique=True, blank=False)
     first_name = models.CharField('First_name', blank=False, max_length=150)
     last_name = models.CharField('Last_name', blank=False, max_length=150)
+    recipes_count = models.PositiveIntegerField(
+        'Recipes_count', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Followers_count', default=0, editable=False)
 
 
 class Subscription(models.Model):